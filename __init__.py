@@ -28,12 +28,18 @@ sudo python3 -m pip install numpy pandas scipy bokeh panel pillow
 
 """.strip() % __version__)
 
-from .parsers.sequence_fasta import read_fasta
-from .parsers.sequence_xma   import read_xma
-
-from .alignment_array.constructor     import gen_array
-from .alignment_array.alignmentarray  import AlignmentArray
+from .parsers.sequence_fasta import read_fasta, read_fasta_bytes
+from .parsers.sequence_faidx import FastaIndex
+from .parsers.sequence_xma   import read_xma, index_xma, read_xma_arrays
+from .parsers.sequence_interleaved import read_stockholm, read_clustal, read_msf
+
+from .alignment_array.constructor     import gen_array, gen_array_records, gen_featurized_array
+from .alignment_array.alignmentarray  import AlignmentArray, EncodedAlignmentArray
+from .alignment_array.alignmentarray  import batch_kldivergence, batch_jsdivergence
+from .alignment_array.alignmentarrayfeaturized import AlignmentArrayFeaturized
 from .alignment_array.headerarray     import SequenceHeaders
+from .alignment_array.store           import write_store, open_store
+from .alignment_array.writers         import write_a2m, write_a3m, write_psicov, write_fasta
 
 from .alignment_array.pottsmodel      import Potts
 from .alignment_array.cdhit           import CD_HIT
@@ -1,13 +1,13 @@
 import sys
-from itertools import groupby
 
 import numpy as np
-from scipy.stats import entropy
-from scipy.spatial.distance import jensenshannon
+from scipy.special import rel_entr
 
 from .sequencelogo import SequenceLogo
-
-AMINO       = 'ARNDCQEGHILKMFPSTWYV-'
+from .encoding import AMINO, RESIDUES, encode_residues, decode_residues, count_residues
+from .weights import henikoff_weights, identity_weights
+from .identity import pairwise_identity, identity_neighbors, identity_pairs
+from .ragged import RaggedColumn, InsertArray, _LOWER
 
 BLOSUM62_BG = 'ARNDCQEGHILKMFPSTWYV', np.array(
             #  A      R      N      D      C      Q      E      G      H      I
@@ -15,6 +15,64 @@ BLOSUM62_BG = 'ARNDCQEGHILKMFPSTWYV', np.array(
             #  L      K      M      F      P      S      T      W      Y      V
              0.092, 0.056, 0.024, 0.044, 0.043, 0.059, 0.055, 0.014, 0.034, 0.072])
 
+def _normalize(P):
+    # rescales each column of a (letters, columns) matrix to sum to 1
+    return P / P.sum(-2, keepdims=True)
+
+def _kldivergence(P, Q):
+    # column-wise kullback leibler divergence between (letters, columns) matrices; broadcasts over leading axes
+    # same as scipy.stats.entropy(p, q) applied to every column
+    return rel_entr(_normalize(P), _normalize(Q)).sum(-2)
+
+def _jsdivergence(P, Q):
+    # column-wise jensen shannon distance between (letters, columns) matrices; broadcasts over leading axes
+    # same as scipy.spatial.distance.jensenshannon(p, q) applied to every column
+    P, Q = _normalize(P), _normalize(Q)
+    M    = (P + Q) / 2
+    return np.sqrt((rel_entr(P, M).sum(-2) + rel_entr(Q, M).sum(-2)) / 2)
+
+def _batch_divergence(fxn, alignments, reference, background, weights):
+    # stacks the probability matrices of all alignments and compares them in as few array operations as possible
+    prob = lambda x: x.probability(alphabet=background[0], weights=weights)[0]
+    P    = np.array([prob(i) for i in alignments])
+    if reference is not None:
+        return fxn(P, prob(reference)[None])
+    return np.array([fxn(i[None], P) for i in P])
+
+def batch_kldivergence(alignments, reference=None, background=BLOSUM62_BG, weights=None):
+    # kullback leibler divergence of each column for many alignments with the same number of columns
+    #     with reference : (alignments, columns) where row i is alignments[i].kldivergence(reference)
+    #     without        : (alignments, alignments, columns) where [i,j] is alignments[i].kldivergence(alignments[j])
+    # weights should be the name of a weighting method so that it applies to every alignment
+    return _batch_divergence(_kldivergence, alignments, reference, background, weights)
+
+def batch_jsdivergence(alignments, reference=None, background=BLOSUM62_BG, weights=None):
+    # jensen shannon divergence of each column for many alignments with the same number of columns
+    #     with reference : (alignments, columns) where row i is alignments[i].jsdivergence(reference)
+    #     without        : (alignments, alignments, columns) where [i,j] is alignments[i].jsdivergence(alignments[j])
+    # weights should be the name of a weighting method so that it applies to every alignment
+    return _batch_divergence(_jsdivergence, alignments, reference, background, weights)
+
+def _squash(columns):
+    # joins columns of strings row by row into one insert column; gaps are dropped and residues lowercased
+    # columns are joined as ragged (offsets + bytes) columns so that memory follows the number of characters
+    joined  = RaggedColumn.join([RaggedColumn.from_strings(i) for i in columns])
+    chars   = _LOWER[joined.buffer]
+    keep    = chars!=0
+    offsets = np.r_[0, np.cumsum(keep)][joined.offsets.astype(np.int64)]
+    return RaggedColumn(offsets, chars[keep]).strings()
+
+def _verify_inserts(old, new):
+    # checks that redefining inserts did not change any of the unaligned sequences
+    unalign = lambda x: ''.join(filter(lambda _: _!='-', x)).lower()
+    assert all(unalign(i)==unalign(j) for i, j in zip(new,old))
+
+def _weights_key(weights):
+    # hashable stand-in for a weight vector (or the name of a weighting method) in cache keys
+    if weights is None or type(weights)==str:
+        return weights
+    return hash(np.asarray(weights, dtype=float).tobytes())
+
 class AlignmentArray(np.ndarray):
     
     #################################################################################
@@ -27,10 +85,32 @@ class AlignmentArray(np.ndarray):
 
     def __array_finalize__(self, obj):
         # indexing and ufuncs pass thru this
+        # views share the write counter of their parent so that writes thru either invalidate both
+        # caches are never shared, but a cached array hands an empty cache to its children
         if obj is None: 
             return
-        self.info = getattr(obj, 'info', None)
-        
+        self.info   = getattr(obj, 'info', None)
+        token       = getattr(obj, '_token', None)
+        shared      = token is not None and np.may_share_memory(self, obj)
+        self._token = token if shared else [0]
+        self._cache = None if getattr(obj, '_cache', None) is None else {}
+
+    def __reduce__(self):
+        # ndarray only pickles the data; attributes of the array and its subclasses (info, inserts, tracks)
+        # travel next to it, with a fresh write counter and an empty cache if caching was enabled
+        fxn, args, state = super().__reduce__()
+        extra = dict(self.__dict__, _token=[0], _cache=None if getattr(self, '_cache', None) is None else {})
+        return fxn, args, (state, extra)
+
+    def __setstate__(self, state):
+        state, extra = state if len(state)==2 else (state, {'_token':[0], '_cache':None})
+        super().__setstate__(state)
+        self.__dict__.update(extra)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._token[0] += 1
+
     def __array_wrap__(self, out_arr, context=None):
         # only ufuncs pass thru this
         # TO DO: test behavior on all possible ufuncs applicable to sequence alignments
@@ -44,138 +124,396 @@ class AlignmentArray(np.ndarray):
         else:
             return out_arr.view(np.ndarray)
 
+    #################################################################################
+    #####  memoized derived state                                               #####
+    #################################################################################
+
+    def cache(self, enable=True):
+        # opt-in memoization of the position mask, alignment positions, match-only view and counts
+        # entries are dropped when the array (or a view sharing its memory) is written to thru indexing
+        # cached results are read-only; arrays derived from a cached array are cached as well
+        self._cache = {} if enable else None
+        return self
+
+    def _cached(self, key, fxn):
+        # returns fxn() memoized under key while the array has not been written to
+        if self._cache is None:
+            return fxn()
+        hit = self._cache.get(key)
+        if hit is None or hit[0]!=self._token[0]:
+            out = fxn()
+            if isinstance(out, np.ndarray):
+                out.flags.writeable = False
+            hit = self._cache[key] = (self._token[0], out)
+        return hit[1]
+
     #################################################################################
     #####  basic functions & properties                                         #####
     #################################################################################
 
     def is_position(self):
         # returns boolean array of whether each column is a position in the alignment
-        ispos = lambda x: False if len(x)!=1 else not x.islower()
-        return np.array(list(map(ispos, self[0])))
+        def ispos():
+            row = np.asarray(self[0]).astype(str)
+            return (np.char.str_len(row)==1) & ~np.char.islower(row)
+        return self._cached(('is_position',), ispos)
 
     def remove_inserts(self):
         # returns alignment array without inserts; needed for doing hard math
-        return self[:,self.is_position()]
+        return self._cached(('remove_inserts',), lambda: self[:,self.is_position()])
     
     def alignment_positions(self): # cols
         # returns the alignment position number for each column in the array
-        is_pos    = self.is_position()
-        positions = np.cumsum(is_pos).astype(float)
-        return positions + (~is_pos * 0.5)
+        def positions():
+            is_pos = self.is_position()
+            return np.cumsum(is_pos).astype(float) + (~is_pos * 0.5)
+        return self._cached(('alignment_positions',), positions)
+
+    def position_index(self):
+        # returns arrays indexed by alignment position <int> giving the column of that position
+        # and the column of the insert that follows it; -1 where there is none
+        #     match[p]  : column of position p (match[0] is always -1)
+        #     insert[p] : column of the insert after position p (insert[0] is the n-terminal insert)
+        def index():
+            is_pos = self.is_position()
+            pos    = np.cumsum(is_pos)
+            cols   = np.arange(len(is_pos))
+            match  = np.full(1+is_pos.sum(), -1)
+            insert = np.full(1+is_pos.sum(), -1)
+            match[pos[is_pos]] = cols[is_pos]
+            insert[pos[~is_pos][::-1]] = cols[~is_pos][::-1]
+            return match, insert
+        return self._cached(('position_index',), index)
+
+    def _position_columns(self, positions):
+        # looks up the columns of many alignment positions at once
+        match     = self.position_index()[0]
+        positions = np.asarray(positions, dtype=int)
+        if ((positions<1) | (positions>=len(match))).any():
+            raise Exception(f'alignment positions must be between 1 and {len(match)-1}')
+        return match[positions]
 
     def get_positions(self, *args):
-        # returns columns based on the alignment positions <int>
+        # returns columns based on the alignment positions <int>; also accepts arrays of positions
         if len(args)==0:
             raise Exception('didnt say which alignment positions you wanted')
         else:
-            ndx = {int(j):i for i,j in enumerate(self.alignment_positions()) if j%1!=0.5}
-            return self[:,[ndx[i] for i in args]]
+            positions = np.concatenate([np.atleast_1d(i) for i in args])
+            return self[:,self._position_columns(positions)]
         
     def get_range(self, start, end):
         # returns columns (with inserts) based on the range of alignment positions <int>
         assert start <= end
         assert {int}==set(map(type,(start,end)))
-        aln_pos = self.alignment_positions()
-        get_ind = lambda x: np.where(x==aln_pos)[0][0]
-        return self[:,get_ind(start):1+get_ind(end)]
+        start, end = self._position_columns((start, end))
+        return self[:,start:1+end]
+
+    def get_ranges(self, ranges):
+        # returns the columns (with inserts) of many ranges of alignment positions in one fancy index
+        # ranges are (start, end) pairs; columns are concatenated in the order given
+        ranges      = np.asarray(ranges, dtype=int).reshape(-1, 2)
+        assert (ranges[:,0] <= ranges[:,1]).all()
+        start, end  = self._position_columns(ranges.ravel()).reshape(-1, 2).T
+        sizes       = 1 + end - start
+        offsets     = np.repeat(start - np.cumsum(sizes) + sizes, sizes)
+        return self[:,offsets + np.arange(sizes.sum())]
+
+    def encode(self):
+        # returns the match states as a uint8 code matrix; inserts are kept separately
+        return self._cached(('encode',), self._encode)
+
+    def _encode(self):
+        # each insert column is placed in the slot before the next alignment position
+        is_pos  = self.is_position()
+        slots   = [[] for i in range(1+is_pos.sum())]
+        for s, col in zip(np.cumsum(is_pos)[~is_pos], np.where(~is_pos)[0]):
+            slots[s] += [RaggedColumn.from_strings(self[:,col])]
+        join    = lambda x: RaggedColumn.join(x) if len(x)>1 else x[0] if len(x) else None
+        columns = [join([j for j in i if j.offsets[-1]>j.offsets[0]]) for i in slots]
+        out = EncodedAlignmentArray(encode_residues(self[:,is_pos]), inserts=InsertArray(columns, self.shape[0]))
+        return out if self._cache is None else out.cache()
 
     #################################################################################
     #####  alignment editing                                                    #####
     #################################################################################
 
-    def define_inserts(self, gap=0.5):
+    def define_inserts(self, gap=0.5, verify=False):
         # redefine inserts based on the proportion of gaps at each alignment position
         # lower gap cutoff = more positions removed
-        inserts = ((self=='-').mean(0) > gap) + ~self.is_position()
-        grouper = groupby(enumerate(inserts), lambda x: x[1])
-        ranges  = [(k, list(i[0] for i in g)) for k, g in grouper]
-        unalign = lambda x: ''.join(filter(lambda _: _!='-', x)).lower()
-        squash  = lambda x: np.array([[unalign(i)] for i in x], dtype=object)
-        proc    = lambda x: squash(self[:,x[1]]) if x[0] else np.array(self[:,x[1]], dtype=object)
-        new_aln = AlignmentArray(np.concatenate(tuple(map(proc,ranges)), axis=1))
-        assert all(unalign(i)==unalign(j) for i, j in zip(new_aln,self))
+        # kept columns are copied with one fancy index; each run of insert columns is squashed column-wise
+        # verify re-joins every sequence to check that the unaligned sequences did not change (slow)
+        inserts = ((self._codes()==RESIDUES.index('-')).mean(0) > gap) | ~self.is_position()
+        edges   = np.flatnonzero(np.diff(inserts.astype(int))) + 1
+        starts  = np.r_[0, edges].astype(int)
+        ends    = np.r_[edges, len(inserts)].astype(int)
+        squash  = inserts[starts]
+        sizes   = np.where(squash, 1, ends-starts)
+        is_new  = np.repeat(squash, sizes)
+        new_aln = np.empty((self.shape[0], sizes.sum()), dtype=object)
+        new_aln[:,~is_new] = self[:,~inserts]
+        is_pos  = self.is_position()
+        for col, start, end in zip(np.flatnonzero(is_new), starts[squash], ends[squash]):
+            if end-start==1 and not is_pos[start]:
+                new_aln[:,col] = self[:,start]
+            else:
+                new_aln[:,col] = _squash(self[:,i] for i in range(start, end))
+        new_aln = AlignmentArray(new_aln)
+        if verify:
+            _verify_inserts(self, new_aln)
         return new_aln
     
     #################################################################################
     #####  position arrays for statistics                                       #####
     #################################################################################
+
+    def _codes(self):
+        # returns the residue codes of every column (see encoding.py)
+        return encode_residues(self)
+
+    def sequence_weights(self, method='identity', threshold=0.8):
+        # returns one weight per sequence to down-weight redundancy, computed over the positions only
+        #     henikoff : position-based weights (Henikoff & Henikoff 1994), sums to 1
+        #     identity : 1 / number of sequences sharing at least threshold identity, sums to neff
+        def weights():
+            codes = self.remove_inserts()._codes()
+            if method=='henikoff':
+                return henikoff_weights(codes)
+            elif method=='identity':
+                return identity_weights(codes, threshold=threshold)
+            raise Exception('Sequence weighting method must be "henikoff" or "identity"')
+        return self._cached(('sequence_weights', method, threshold), weights)
+
+    def _resolve_weights(self, weights):
+        # weights are given as one weight per sequence or as the name of a weighting method
+        return self.sequence_weights(weights) if type(weights)==str else weights
+
+    def counts(self, alphabet=AMINO, weights=None):
+        # returns the number of occurences of each letter at each column; shared by all statistics
+        # weights gives one weight per sequence (float counts), otherwise integer counts
+        key = ('counts', ''.join(alphabet), _weights_key(weights))
+        fxn = lambda: count_residues(self._codes(), alphabet, weights=self._resolve_weights(weights))
+        return self._cached(key, fxn)
+
+    def _probability(self, alphabet, pseudocount, weights=None):
+        # position probability matrix memoized per alphabet, pseudocount and weights
+        def probability():
+            F = self.counts(alphabet, weights=weights) + pseudocount
+            return F / F.sum(0)
+        return self._cached(('probability', ''.join(alphabet), pseudocount, _weights_key(weights)), probability)
     
-    def frequency(self, alphabet=AMINO):
+    def frequency(self, alphabet=AMINO, weights=None):
         # returns position frequency matrix
         assert all(self.is_position())
-        F = np.array([(i==self).sum(axis=0) for i in alphabet])
+        F = self.counts(alphabet, weights=weights)
         return F, np.array(list(alphabet))
 
-    def probability(self, alphabet=AMINO, pseudocount=0):
+    def probability(self, alphabet=AMINO, pseudocount=0, weights=None):
         # returns position probability matrix
         assert all(self.is_position())
-        F = np.array([(i==self).sum(axis=0) for i in alphabet]) + pseudocount
-        P = F / F.sum(0)
+        P = self._probability(alphabet, pseudocount, weights)
         return P, np.array(list(alphabet))
 
-    def entropy(self, alphabet=AMINO, pseudocount=0):
+    def entropy(self, alphabet=AMINO, pseudocount=0, weights=None):
         # returns the shannon entropy of each position
         assert all(self.is_position())
-        F = np.array([(i==self).sum(axis=0) for i in alphabet]) + pseudocount
-        P = F / F.sum(0)
+        P = self._probability(alphabet, pseudocount, weights)
         S = -(P * np.log(P, where=P!=0)).sum(0)
         return S, np.array(list(alphabet))
     
-    def nats(self, alphabet=AMINO, pseudocount=0):
+    def nats(self, alphabet=AMINO, pseudocount=0, weights=None):
         # returns the information in each position in nats
         assert all(self.is_position())
-        F = np.array([(i==self).sum(axis=0) for i in alphabet]) + pseudocount
-        P = F / F.sum(0)
+        P = self._probability(alphabet, pseudocount, weights)
         I = np.log(len(alphabet))+(P * np.log(P, where=P!=0)).sum(0)
         return I
 
-    def bits(self, alphabet=AMINO, pseudocount=0):
+    def bits(self, alphabet=AMINO, pseudocount=0, weights=None):
         # returns the information in each position in bits
         assert all(self.is_position())
-        F = np.array([(i==self).sum(axis=0) for i in alphabet]) + pseudocount
-        P = F / F.sum(0)
+        P = self._probability(alphabet, pseudocount, weights)
         I = np.log2(len(alphabet))+(P * np.log2(P, where=P!=0)).sum(0)
         return I
 
-    def kldivergence(self, *arg, background=BLOSUM62_BG):
+    def kldivergence(self, *arg, background=BLOSUM62_BG, weights=None):
         # calculates kullback leibler divergence of each column to the background; does not yield bidirectional equality
         # if argument is given, compares each column of the 2 alignments, number of columns must be same in both
+        # weights apply to this alignment; a weighting method name (eg. "identity") applies to both
         assert all(self.is_position())
+        other = weights if type(weights)==str else None
         if len(arg)>1:
             raise Exception('Provide only 1 argument to be compared against or none to compare against the BLOSUM62 background')
         elif len(arg)==1:
-            assert arg[0].shape[1], self.shape[1] 
-            b = self.probability(alphabet=background[0])[0].T
-            q = arg[0].probability(alphabet=background[0])[0].T
-            return np.array([entropy(*i) for i in zip(b, q)])
+            assert arg[0].shape[1]==self.shape[1]
+            b = self.probability(alphabet=background[0], weights=weights)[0]
+            q = arg[0].probability(alphabet=background[0], weights=other)[0]
+            return _kldivergence(b, q)
         elif len(arg)==0:
-            p = self.probability(alphabet=background[0])[0].T
-            return np.array([entropy(i,background[1]) for i in p])
+            p = self.probability(alphabet=background[0], weights=weights)[0]
+            return _kldivergence(p, background[1][:,None])
 
-    def jsdivergence(self, *arg, background=BLOSUM62_BG):
+    def jsdivergence(self, *arg, background=BLOSUM62_BG, weights=None):
         # calculates jensen shannon divergence of each column to the background; will yield bidirectional equality
         # if argument is given, compares each column of the 2 alignments, number of columns must be same in both
+        # weights apply to this alignment; a weighting method name (eg. "identity") applies to both
         assert all(self.is_position())
+        other = weights if type(weights)==str else None
         if len(arg)>1:
             raise Exception('Provide only 1 argument to be compared against or none to compare against the BLOSUM62 background')
         elif len(arg)==1:
-            assert arg[0].shape[1], self.shape[1] 
-            b = self.probability(alphabet=background[0])[0].T
-            q = arg[0].probability(alphabet=background[0])[0].T
-            return np.array([jensenshannon(*i) for i in zip(b, q)])
+            assert arg[0].shape[1]==self.shape[1]
+            b = self.probability(alphabet=background[0], weights=weights)[0]
+            q = arg[0].probability(alphabet=background[0], weights=other)[0]
+            return _jsdivergence(b, q)
         elif len(arg)==0:
-            p = self.probability(alphabet=background[0])[0].T
-            return np.array([jensenshannon(i,background[1]) for i in p])
+            p = self.probability(alphabet=background[0], weights=weights)[0]
+            return _jsdivergence(p, background[1][:,None])
+
+    #################################################################################
+    #####  pairwise comparisons                                                 #####
+    #################################################################################
+
+    def identity(self, other=None, out=None, **kwargs):
+        # returns the pairwise identity over positions between all sequences, or against other
+        # out can be a filename to write the matrix into a .npy memmap for large alignments
+        # kwargs (block_size, threads, memory) are passed on to the blocked engine in identity.py
+        other = None if other is None else other.remove_inserts()._codes()
+        return pairwise_identity(self.remove_inserts()._codes(), other, out=out, **kwargs)
+
+    def identity_neighbors(self, other=None, k=10, **kwargs):
+        # returns (indices, identities) of the k most similar sequences for each sequence
+        other = None if other is None else other.remove_inserts()._codes()
+        return identity_neighbors(self.remove_inserts()._codes(), other, k=k, **kwargs)
+
+    def identity_pairs(self, other=None, threshold=0.8, **kwargs):
+        # returns (rows, other rows, identities) of all pairs of sequences at or above threshold identity
+        other = None if other is None else other.remove_inserts()._codes()
+        return identity_pairs(self.remove_inserts()._codes(), other, threshold=threshold, **kwargs)
 
     ####################################################################################
     #####  visualizations                                                          #####
     ####################################################################################
 
-    def logo(self):
-        return SequenceLogo(self)
+    def logo(self, weights=None):
+        return SequenceLogo(self, weights=weights)
+
+    def show_logo(self, weights=None, **kwargs):
+        return SequenceLogo(self, weights=weights).plot(**kwargs)
+
 
-    def show_logo(self, **kwargs):
-        return SequenceLogo(self).plot(**kwargs)
+class EncodedAlignmentArray(AlignmentArray):
+    """
+        match states are stored as a contiguous uint8 code matrix over RESIDUES (AMINO first), other bytes after them
+        inserts are kept separately as a ragged InsertArray with one slot per gap between positions
+            inserts[:,0]  : insert before the first position (n-terminal flank)
+            inserts[:,i]  : insert between position i and i+1
+            inserts[:,-1] : insert after the last position (c-terminal flank)
+        use decode() to get back the object representation
+    """
+    
+    #################################################################################
+    #####  inherit np.ndarray                                                   #####
+    #################################################################################
+    
+    def __new__(cls, codes, inserts=None):
+        # inserts may also be given as a (sequences, slots) array of python strings
+        obj = np.ascontiguousarray(codes, dtype=np.uint8).view(cls)
+        obj.inserts = InsertArray.from_strings(inserts) if isinstance(inserts, np.ndarray) else inserts
+        return obj
+    
+    def __array_finalize__(self, obj):
+        # inserts only carry over when the rows and columns still line up (copies, views)
+        # indexing is handled by __getitem__ which knows which rows and columns were taken
+        super().__array_finalize__(obj)
+        if obj is None:
+            return
+        inserts      = getattr(obj, 'inserts', None)
+        aligned      = inserts is not None and self.shape==obj.shape
+        self.inserts = inserts if aligned else None
+    
+    def __getitem__(self, key):
+        out = super().__getitem__(key)
+        if isinstance(out, EncodedAlignmentArray):
+            out.inserts = self._index_inserts(key, out)
+        return out
+    
+    def _index_inserts(self, key, out, inserts=None):
+        # rows are taken as is; columns keep their inserts only for contiguous slices
+        # inserts defaults to the residue inserts; other InsertArrays of the same shape can be indexed alike
+        key     = key if type(key)==tuple else (key,)
+        inserts = self.inserts if inserts is None else inserts
+        if inserts is None or out.ndim!=2 or any(i is Ellipsis or i is None for i in key):
+            return None
+        rows, cols = (tuple(key) + (slice(None),)*2)[:2]
+        inserts    = inserts[rows]
+        if type(cols)!=slice or cols.step not in (None, 1):
+            return None
+        start, stop, _ = cols.indices(self.shape[1])
+        return inserts[:,start:1+max(start,stop)]
+    
+    #################################################################################
+    #####  basic functions & properties                                         #####
+    #################################################################################
+    
+    def is_position(self):
+        # every column of the code matrix is a position in the alignment
+        return self._cached(('is_position',), lambda: np.ones(self.shape[1], dtype=bool))
+    
+    def remove_inserts(self):
+        # returns a view of the code matrix without inserts
+        def view():
+            out         = self.view(EncodedAlignmentArray)
+            out.inserts = None
+            return out
+        return self._cached(('remove_inserts',), view)
+    
+    def encode(self):
+        return self
+    
+    def decode(self, drop_empty=True):
+        # returns the object representation; insert slots that are empty in every row are dropped
+        # unless drop_empty=False, which gives every slot a column
+        match = decode_residues(self)
+        if self.inserts is None:
+            return AlignmentArray(match)
+        used  = self.inserts.used() | (not drop_empty)
+        slot  = lambda x: [self.inserts.column(x)[:,None]] if used[x] else []
+        cols  = []
+        for i in range(self.shape[1]):
+            cols += slot(i)
+            cols += [match[:,[i]]]
+        cols += slot(-1)
+        return AlignmentArray(np.concatenate(cols, axis=1))
+    
+    #################################################################################
+    #####  alignment editing                                                    #####
+    #################################################################################
+    
+    def define_inserts(self, gap=0.5, verify=False):
+        # converts positions with too many gaps into inserts without decoding the match states
+        # the new insert between kept positions a and b joins the old inserts and converted positions in between
+        codes   = self._codes()
+        keep    = np.flatnonzero((codes==RESIDUES.index('-')).mean(0) <= gap)
+        slots   = self.inserts if self.inserts is not None else InsertArray.empty(self.shape[0], 1+self.shape[1])
+        bounds  = np.r_[-1, keep, self.shape[1]]
+        columns = []
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            parts    = [slots.columns[a+1]]
+            for i in range(a+1, b):
+                parts += [RaggedColumn.from_codes(codes[:,i]), slots.columns[i+1]]
+            parts    = [i for i in parts if i is not None and i.offsets[-1]>i.offsets[0]]
+            columns += [None if len(parts)==0 else parts[0] if len(parts)==1 else RaggedColumn.join(parts)]
+        new_aln = EncodedAlignmentArray(codes[:,keep], inserts=InsertArray(columns, self.shape[0]))
+        if verify:
+            _verify_inserts(self.decode(), new_aln.decode())
+        return new_aln
+    
+    #################################################################################
+    #####  position arrays for statistics                                       #####
+    #################################################################################
+    
+    def _codes(self):
+        # the array already holds codes
+        return self.view(np.ndarray)
     
 
 
@@ -1,14 +1,84 @@
 import numpy as np
 
-class AlignmentArrayFeaturized(np.ndarray):
+from .alignmentarray import EncodedAlignmentArray
+from .encoding import byte_table, count_residues
+
+class AlignmentArrayFeaturized(EncodedAlignmentArray):
     """
-        uses references as array element dtype
+        encoded alignment with per residue feature tracks (secondary structure, disorder, ...) read from cfa files
+        the residues are an EncodedAlignmentArray; every track follows the same column layout
+            tracks[name]        : (sequences, positions) uint8 feature characters of the match states,
+                                  or float32 values when the track was read with a value mapping (nan when unmapped)
+            track_inserts[name] : InsertArray of the feature characters of inserted residues
+        per position statistics work on the whole track matrix at once
     """
 
-    def __new__(cls, ndarray, names=None):
-        obj = np.asarray(ndarray, dtype=object).view(cls)
+    #################################################################################
+    #####  inherit np.ndarray                                                   #####
+    #################################################################################
+
+    def __new__(cls, codes, inserts=None, tracks=None, track_inserts=None):
+        obj = super().__new__(cls, codes, inserts)
+        obj.tracks        = dict(tracks or {})
+        obj.track_inserts = dict(track_inserts or {})
         return obj
 
     def __array_finalize__(self, obj):
-        if obj is None: 
+        # tracks only carry over when the rows and columns still line up, like inserts
+        super().__array_finalize__(obj)
+        if obj is None:
             return
+        aligned            = self.shape==getattr(obj, 'shape', None)
+        self.tracks        = dict(getattr(obj, 'tracks', {})) if aligned else {}
+        self.track_inserts = dict(getattr(obj, 'track_inserts', {})) if aligned else {}
+
+    def __getitem__(self, key):
+        out = super().__getitem__(key)
+        if isinstance(out, AlignmentArrayFeaturized):
+            out.tracks        = {k: v[key] for k, v in self.tracks.items()}
+            out.track_inserts = {k: self._index_inserts(key, out, v) for k, v in self.track_inserts.items() if v is not None}
+        return out
+
+    #################################################################################
+    #####  feature statistics                                                   #####
+    #################################################################################
+
+    def track_alphabet(self, track):
+        # returns the feature characters found in a character track
+        return bytes(np.flatnonzero(np.bincount(self.tracks[track].ravel(), minlength=256)).astype(np.uint8)).decode()
+
+    def feature_counts(self, track, alphabet=None, weights=None):
+        # returns (counts, alphabet) with the (weighted) number of each feature character at each position
+        alphabet = self.track_alphabet(track) if alphabet is None else ''.join(alphabet)
+        weights  = self._resolve_weights(weights)
+        F        = count_residues(self.tracks[track], alphabet, weights=weights, table=byte_table(alphabet))
+        return F, np.array(list(alphabet))
+
+    def feature_frequency(self, track, states, ignore='-', weights=None):
+        # returns the fraction of sequences whose feature is one of states at each position
+        # sequences with an ignored feature (no residue) at a position are left out of that position
+        states  = ''.join(states)
+        F, _    = self.feature_counts(track, states + ''.join(ignore), weights=weights)
+        weights = self._resolve_weights(weights)
+        total   = (self.shape[0] if weights is None else np.sum(weights)) - F[len(states):].sum(0)
+        return np.divide(F[:len(states)].sum(0), total, out=np.zeros(self.shape[1]), where=total>0)
+
+    def feature_values(self, track, values):
+        # returns a float matrix of a character track mapped thru values ({char: value} or a string of chars
+        # standing for 0, 1, 2 ...); characters that are not mapped become nan
+        if self.tracks[track].dtype!=np.uint8:
+            return self.tracks[track]
+        values = dict(zip(values, range(len(values)))) if type(values)==str else values
+        table  = np.full(256, np.nan, dtype=np.float32)
+        for k, v in values.items():
+            table[ord(k)] = v
+        return table[self.tracks[track]]
+
+    def feature_mean(self, track, values=None, weights=None):
+        # returns the (weighted) mean value of a track at each position over the sequences that have a value
+        V       = self.feature_values(track, values) if values is not None else self.tracks[track]
+        weights = self._resolve_weights(weights)
+        w       = np.ones(self.shape[0]) if weights is None else np.asarray(weights, dtype=float)
+        known   = ~np.isnan(V)
+        total   = w @ known
+        return np.divide(w @ np.where(known, V, 0), total, out=np.full(self.shape[1], np.nan), where=total>0)
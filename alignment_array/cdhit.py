@@ -4,6 +4,8 @@ from subprocess import call, DEVNULL
 
 import numpy as np
 
+from .writers import write_fasta
+
 class CD_HIT:
     def __init__(self):
         return
@@ -23,14 +25,11 @@ class CD_HIT:
 
         nseqs   = A.shape[0]
         digits  = int(np.ceil(np.log10(1+nseqs)))
-        unalign = lambda x: ''.join(x).replace('-','').upper()
         pad_int = lambda x: 'NDX'+str(x).zfill(digits)
         infile  = f'cdhit_{rand}.fasta'
 
         try:
-            with open(infile, 'w') as w:
-                for n, s in enumerate(map(unalign,A)):
-                    w.write(f'>{pad_int(n)}\n{s}\n')
+            write_fasta(infile, A, [pad_int(n) for n in range(nseqs)])
 
             indices = {}
             is_head = lambda x: x.startswith('>')
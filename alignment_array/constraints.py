@@ -1,10 +1,26 @@
-import sys
 import re
 from itertools import groupby
 
 import numpy as np
 import pandas as pd
 
+from .encoding import RESIDUES, byte_table, fold_unknown
+
+def _score(codes, positions, weights):
+    """
+    scores every sequence against every constraint set
+    codes     : (sequences, positions) match state codes
+    positions : (sets, constraints) 0 based column of each constraint
+    weights   : (sets, constraints, residues) weight each residue code gets from each constraint
+    returns (sets, sequences); each set adds its constraints in order, like scoring them one at a time
+    """
+    codes = fold_unknown(codes)
+    sets  = np.arange(positions.shape[0])[:,None]
+    s     = np.zeros((positions.shape[0], codes.shape[0]))
+    for j in range(positions.shape[1]):
+        s += weights[sets, j, codes[:,positions[:,j]].T]
+    return s
+
 def read_lpr(file):
     """
     generator: yields each category in an lpr file
@@ -64,13 +80,18 @@ class Constraints:
         n = ('Set %s' % self.name) if type(self.name)==int else self.name
         return '<Constraints: "%s" containing %s constraints>' % (n, len(self.positions))
     
+    def compile(self):
+        # returns (columns, weights); the 0 based column of each constraint (indices = position - 1) and
+        # a (constraints, residues) matrix of its weight for each residue code, 0 for residues it does not allow
+        table = byte_table(RESIDUES)
+        hit   = np.zeros((len(self.positions), len(RESIDUES)+1))
+        for n, r in enumerate(self.residues):
+            hit[n, table[np.frombuffer(r.encode(), dtype=np.uint8)]] = 1
+        return self.positions - 1, self.norm[:,None] * hit[:,:-1]
+    
     def fit(self, x):
-        # assume indices = position - 1
-        x = x.remove_inserts()
-        s = np.zeros(x.shape[0])
-        for r, n, w in zip(self.residues, self.positions-1, self.norm):
-            s += w*np.array([a==x[:,n] for a in r]).any(0)
-        return s
+        positions, weights = self.compile()
+        return _score(x.remove_inserts()._codes(), positions[None], weights[None])[0]
 
 class SequenceConstraints:
     """
@@ -125,13 +146,21 @@ class SequenceConstraints:
             c.name = names[c.name]
         return self
     
+    def compile(self):
+        # returns (positions, weights) of every set, padded with constraints of weight 0 (see Constraints.compile)
+        compiled  = [c.compile() for c in self]
+        size      = max([len(i[0]) for i in compiled], default=0)
+        positions = np.zeros((len(compiled), size), dtype=int)
+        weights   = np.zeros((len(compiled), size, len(RESIDUES)))
+        for n, (p, w) in enumerate(compiled):
+            positions[n,:len(p)] = p
+            weights[n,:len(w)]   = w
+        return positions, weights
+    
     def fit(self, x):
-        t, s, a = len(self), [], []
-        for n, c in enumerate(self):
-            sys.stderr.write('SequenceConstraints : fitting %s out of %s\r' % (1+n, t))
-            s += [c.fit(x)]
-            a += [c.name]
-        return a, np.array(s).astype(np.float16)
+        # scores every sequence against every set in one pass over the match states
+        positions, weights = self.compile()
+        return [c.name for c in self], _score(x.remove_inserts()._codes(), positions, weights).astype(np.float16)
 
     def export(self, file):
         w = open(file, 'w')
@@ -1,73 +1,370 @@
+import os
 import sys
+import numbers
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
-from ..parsers.sequence_fasta import read_fasta
+from ..parsers.sequence_fasta import read_fasta_bytes, fasta_compression
+from ..parsers.sequence_cfa   import read_cfa
 
-from .headerarray import SequenceHeaders
-from .alignmentarray import AlignmentArray
+from .headerarray import SequenceHeaders, header_predicate
+from .alignmentarray import EncodedAlignmentArray
+from .alignmentarrayfeaturized import AlignmentArrayFeaturized
+from .encoding import residue_table
+from .ragged import RaggedColumn, InsertArray, _ragged_index, _offset_dtype
+from .store import write_store, open_store, store_is_current
 
-def gen_array(infile, **kwargs):
-    
-    def vectorize_aligned_sequence(seq, flanking=True):
-        is_insert  = lambda x: x.islower()
-        now_insert = True
-        was_insert = True
-        A          = ['']
-        for x in seq:
-            now_insert = is_insert(x)
-            if now_insert:
-                if was_insert:
-                    A[-1] += x
-                else:
-                    A += [x]
+def vectorize_aligned_sequence(seq, flanking=True):
+    is_insert  = lambda x: x.islower()
+    now_insert = True
+    was_insert = True
+    A          = ['']
+    for x in seq:
+        now_insert = is_insert(x)
+        if now_insert:
+            if was_insert:
+                A[-1] += x
+            else:
+                A += [x]
+        else:
+            if was_insert:
+                A += [x]
             else:
-                if was_insert:
-                    A += [x]
-                else:
-                    A += ['',x]
-            was_insert = now_insert
-        if not is_insert(A[-1][0]):
-            A += ['']
-        return A if flanking else A[1:-1]
+                A += ['',x]
+        was_insert = now_insert
+    if not is_insert(A[-1][0]):
+        A += ['']
+    return A if flanking else A[1:-1]
+
+_INSERT = np.zeros(256, dtype=bool)
+_INSERT[np.frombuffer(b'abcdefghijklmnopqrstuvwxyz', dtype=np.uint8)] = True
+
+def tokenize_aligned_sequence(seq, flanking=True):
+    # bytes level equivalent of vectorize_aligned_sequence; seq may be str or bytes
+    # returns (match, sizes, inserts) as uint8 match characters, the length of the insert in front of
+    # each match plus the trailing one (positions+1), and the insert characters one slot after another
+    # without flanking the inserts before the first and after the last match are dropped
+    chars   = np.frombuffer(seq if type(seq)==bytes else seq.encode('ascii', 'replace'), dtype=np.uint8)
+    insert  = _INSERT[chars]
+    where   = np.flatnonzero(~insert)
+    sizes   = np.diff(np.r_[-1, where, len(chars)]) - 1
+    inserts = chars[insert]
+    if not flanking:
+        inserts    = inserts[sizes[0]:len(inserts)-sizes[-1]]
+        sizes[[0, -1]] = 0
+    return chars[where], sizes, inserts
+
+def tokenize_tracks(seq, tracks, flanking=True):
+    # splits feature lines (one character per character of seq) at the match states and inserts of seq
+    # returns (match, sizes, inserts) of seq followed by a (match, inserts) pair for every track
+    match, sizes, inserts = tokenize_aligned_sequence(seq, flanking=flanking)
+    chars  = np.frombuffer(seq if type(seq)==bytes else seq.encode('ascii', 'replace'), dtype=np.uint8)
+    insert = _INSERT[chars]
+    where  = np.flatnonzero(~insert)
+    keep   = insert if flanking else insert & (np.arange(len(chars)) > where[0]) & (np.arange(len(chars)) < where[-1])
+    out    = []
+    for track in tracks:
+        values = np.frombuffer(track if type(track)==bytes else track.encode('ascii', 'replace'), dtype=np.uint8)
+        if len(values)!=len(chars):
+            raise Exception(f'feature line has {len(values)} characters instead of {len(chars)}')
+        out   += [(values[where], values[keep])]
+    return match, sizes, inserts, out
+
+def tokens_to_list(match, sizes, inserts, flanking=True):
+    # rebuilds the list layout of vectorize_aligned_sequence out of tokenize_aligned_sequence output
+    ends    = np.cumsum(sizes)
+    inserts = bytes(inserts).decode()
+    A       = [j for i in range(len(match)) for j in (inserts[ends[i]-sizes[i]:ends[i]], chr(match[i]))]
+    A      += [inserts[ends[-1]-sizes[-1]:]]
+    return A if flanking else A[1:-1]
+
+class EncodedBuffer:
+    """
+        growable storage for encoded rows while an alignment is being read
+        rows are written into preallocated chunks, so nothing is transposed or copied until finish()
+            codes   : (rows, positions) uint8 match states
+            runs    : slot and length of every non-empty insert (int32), with the number of them per row
+            inserts : insert bytes of every row, one row after another
+        empty inserts cost nothing, so memory follows the match states and the insert bytes
+        slots that get an insert are tracked as rows come in
+    """
+    def __init__(self, npos, chunk_size=4096):
+        self.npos       = npos
+        self.chunk_size = chunk_size
+        self.codes      = []
+        self.slots      = bytearray()
+        self.lengths    = bytearray()
+        self.counts     = bytearray()
+        self.inserts    = bytearray()
+        self.used       = np.zeros(npos+1, dtype=bool)
+        self.nrow       = 0
+    
+    def __len__(self):
+        return self.nrow
+    
+    def append(self, codes, sizes, inserts):
+        row = self.nrow % self.chunk_size
+        if row==0:
+            self.codes += [np.empty((self.chunk_size, self.npos), dtype=np.uint8)]
+        slots               = np.flatnonzero(sizes)
+        self.codes[-1][row] = codes
+        self.slots         += slots.astype(np.int32).tobytes()
+        self.lengths       += np.asarray(sizes)[slots].astype(np.int32).tobytes()
+        self.counts        += np.int32(len(slots)).tobytes()
+        self.used[slots]    = True
+        self.inserts       += inserts
+        self.nrow          += 1
+    
+    def arrays(self):
+        # returns the (codes, runs, insert bytes) written so far as contiguous arrays
+        # runs are the (rows, slots, lengths) of the non-empty inserts in row order (see _assemble)
+        last  = self.nrow - self.chunk_size * (len(self.codes) - 1)
+        stack = lambda x, n: np.concatenate(x[:-1] + [x[-1][:last]]) if len(x) else np.zeros((0, n), dtype=np.uint8)
+        rows  = np.repeat(np.arange(self.nrow, dtype=np.int32), np.frombuffer(self.counts, dtype=np.int32))
+        runs  = rows, np.frombuffer(self.slots, dtype=np.int32), np.frombuffer(self.lengths, dtype=np.int32)
+        return stack(self.codes, self.npos), runs, np.frombuffer(self.inserts, dtype=np.uint8)
     
-    def fast_check(infile, max_iter=420):
-        get_vlen = lambda x: len(vectorize_aligned_sequence(x))
-        reader   = read_fasta(infile)
-        vlen     = get_vlen(next(reader)[1])
-        for n, (h, s) in enumerate(read_fasta(infile)):
-            if n > max_iter:
+    def finish(self):
+        # returns the EncodedAlignmentArray and releases the chunks
+        codes, runs, inserts = self.arrays()
+        self.codes, self.inserts = [], bytearray()
+        self.slots, self.lengths, self.counts = bytearray(), bytearray(), bytearray()
+        return _assemble(codes, runs, inserts, self.used)
+
+def _assemble(codes, runs, buffer, used):
+    # builds an EncodedAlignmentArray from row ordered (codes, insert runs, insert bytes)
+    # runs are the (rows, slots, lengths) of the non-empty inserts, in the order their bytes follow each other in buffer
+    # inserts are regrouped from row order into one ragged column per used slot
+    nrow, npos           = codes.shape
+    rows, slots, lengths = runs
+    starts  = np.cumsum(lengths, dtype=np.int64) - lengths
+    order   = np.argsort(slots, kind='stable')
+    bounds  = np.searchsorted(slots[order], np.arange(npos+2))
+    columns = [None] * (npos+1)
+    for i in np.flatnonzero(used):
+        take       = order[bounds[i]:bounds[i+1]]
+        sizes      = np.zeros(nrow, dtype=np.int64)
+        sizes[rows[take]] = lengths[take]
+        column     = buffer[_ragged_index(starts[take], lengths[take].astype(np.int64))]
+        columns[i] = RaggedColumn(np.r_[0, np.cumsum(sizes)].astype(_offset_dtype(len(column))), column)
+    return EncodedAlignmentArray(codes, inserts=InsertArray(columns, nrow))
+
+def _encode_records(reader, flanking=True, max_seqs=-1, reporter=lambda n: None):
+    # encodes (name, sequence) records into an EncodedBuffer; names and sequences may be str or bytes
+    # returns (names, buffer, bad) where bad is (record, name, positions, expected) for the first record
+    # whose number of positions differs from the first record, in which case reading stops there
+    exceeded   = lambda x: x == max_seqs - 1
+    table      = residue_table()
+    names, buf = [], None
+    n          = -1
+    for n, (name, seq) in enumerate(reader):
+        name    = name if type(name)==str else name.decode()
+        match, sizes, inserts = tokenize_aligned_sequence(seq, flanking=flanking)
+        if buf is None:
+            buf = EncodedBuffer(len(match), chunk_size=max_seqs if 0 < max_seqs < 4096 else 4096)
+        if len(match)!=buf.npos:
+            return names, buf, (n, name, len(match), buf.npos)
+        names += [name]
+        buf.append(table[match], sizes, inserts.tobytes())
+        if n % 1000 == 999:
+            reporter(n)
+        if exceeded(n):
+            break
+    reporter(n)
+    return names, buf, None
+
+def _select_records(reader, select=None, stride=1, sample=None, seed=None):
+    # filters (name, sequence) records before they are tokenized, in this order:
+    #     select : header predicate (see headerarray.header_predicate)
+    #     stride : keeps every stride-th selected record
+    #     sample : real number, keeps each record with that probability; integer, reservoir sample of that many records
+    # records keep their file order; seed makes the sampling reproducible
+    keep    = header_predicate(select)
+    decode  = lambda x: x if type(x)==str else x.decode()
+    records = (i for i in reader if keep(decode(i[0])))
+    if stride > 1:
+        records = (j for i, j in enumerate(records) if i % stride == 0)
+    rng     = np.random.default_rng(seed)
+    if sample is None:
+        return records
+    integral = isinstance(sample, numbers.Integral) and not isinstance(sample, bool) and sample >= 0
+    fraction = isinstance(sample, numbers.Real) and not isinstance(sample, (bool, numbers.Integral)) and 0 <= sample <= 1
+    if not (integral or fraction):
+        raise Exception(f'sample must be a fraction between 0 and 1 or a number of records, not {sample!r}')
+    if fraction:
+        return (i for i in records if rng.random() < sample)
+    reservoir = []
+    for n, record in enumerate(records):
+        if n < sample:
+            reservoir += [(n, record)]
+            continue
+        j = rng.integers(n+1)
+        if j < sample:
+            reservoir[j] = (n, record)
+    return (record for n, record in sorted(reservoir, key=lambda x: x[0]))
+
+def _split_ranges(infile, nblocks):
+    # returns (start, stop) byte ranges that cover infile, each starting at a ">" at the beginning of a line
+    size   = os.path.getsize(infile)
+    bounds = [0]
+    with open(infile, 'rb') as f:
+        for i in range(1, nblocks):
+            f.seek(max(bounds[-1], i * size // nblocks))
+            chunk, skipped = b'', f.tell()
+            while True:
+                block = f.read(2**16)
+                found = (chunk[-1:] + block).find(b'\n>')
+                if found >= 0 or not block:
+                    break
+                skipped += len(block)
+                chunk    = block
+            if not block:
                 break
-            if vlen != get_vlen(s):
-                raise Exception(f'Input file "{infile}" does not seem properly aligned')
+            bounds += [skipped - len(chunk[-1:]) + found + 1]
+    bounds = sorted(set(bounds)) + [size]
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def _encode_range(infile, start, stop, flanking=True, select=None):
+    # worker for parallel parsing; returns (names, codes, insert runs, insert bytes, used slots, bad) for one byte range
+    with open(infile, 'rb') as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    reader = _select_records(read_fasta_bytes(data, decode=False), select=select)
+    names, buf, bad = _encode_records(reader, flanking=flanking)
+    if buf is None:
+        return names, None, None, None, None, bad
+    return (names, *buf.arrays(), buf.used, bad)
+
+def _encode_parallel(infile, processes, flanking=True, select=None, reporter=lambda n: None):
+    # parses byte ranges of infile in a process pool and concatenates the encoded blocks in file order
+    # returns (names, EncodedAlignmentArray, bad) like reading the file serially and finishing the buffer
+    ranges = _split_ranges(infile, 4 * processes)
+    with ProcessPoolExecutor(processes) as pool:
+        blocks = list(pool.map(_encode_range, *zip(*[(infile, a, b, flanking, select) for a, b in ranges])))
+    blocks = [i for i in blocks if i[1] is not None or i[-1] is not None]
+    if len(blocks)==0:
+        return [], None, None
+    npos   = blocks[0][1].shape[1]
+    names  = []
+    for block_names, codes, runs, inserts, used, bad in blocks:
+        if codes is not None and codes.shape[1]!=npos:
+            return names, None, (len(names), block_names[0], codes.shape[1], npos)
+        if bad is not None:
+            return names, None, (len(names) + bad[0], bad[1], bad[2], npos)
+        names += block_names
+    reporter(len(names) - 1)
+    first  = np.cumsum([0] + [len(i[1]) for i in blocks])
+    codes  = np.concatenate([i[1] for i in blocks])
+    runs   = [np.concatenate([i[2][0] + n for i, n in zip(blocks, first)])] + \
+             [np.concatenate([i[2][j] for i in blocks]) for j in (1, 2)]
+    used   = np.any([i[4] for i in blocks], axis=0)
+    aln    = _assemble(codes, runs, np.concatenate([i[3] for i in blocks]), used)
+    return names, aln, None
+
+def _check_records(label, aln, bad):
+    # raises for misaligned or empty input, as reported by _encode_records or _encode_parallel
+    if bad is not None:
+        raise Exception(f'Input file "{label}" does not seem properly aligned: '
+                        f'record {1+bad[0]} "{bad[1]}" has {bad[2]} positions instead of {bad[3]}')
+    if aln is None:
+        raise Exception(f'Input file "{label}" does not contain any sequences')
+
+def _finish_array(aln, encode=False, flanking=True, remove_unused_cols=True, **kwargs):
+    # returns the encoded array, or the object array layout that gen_array gives for these options
+    if encode:
+        return aln
+    aln = aln.decode(drop_empty=remove_unused_cols)
+    return aln if flanking or remove_unused_cols else aln[:,1:-1]
+
+def gen_array_records(records, encode=False, flanking=True, remove_unused_cols=True, max_seqs=-1, label='records'):
+    # same as gen_array for any iterable of (name, aligned sequence), e.g. blocks of other alignment formats
+    names, buf, bad = _encode_records(records, flanking=flanking, max_seqs=max_seqs)
+    aln = None if buf is None or bad is not None else buf.finish()
+    _check_records(label, aln, bad)
+    return SequenceHeaders(np.array(names, dtype=object)), _finish_array(aln, encode, flanking, remove_unused_cols)
+
+def gen_array(infile, encode=False, store=None, **kwargs):
+    # infile is a filename (plain, gzip, bz2 or xz) or an open file/pipe/stream, which is read exactly once
+    # store keeps a binary container of the parsed alignment (see store.py) and reuses it while the source is unchanged
+    #     store=True uses infile + ".hbaln"; a string gives the path of the container
     
-    def parse_file(infile, flanking=True, remove_unused_cols=True, max_seqs=-1, quiet=False):
-        printrow   = lambda x: sys.stderr.write('Importing Row : %s\r' % (1+n))
+    def parse_file(infile, flanking=True, remove_unused_cols=True, max_seqs=-1, quiet=False, processes=1,
+                   select=None, stride=1, sample=None, seed=None):
+        # rows are encoded as they are read into an EncodedAlignmentArray
+        # every record is checked against the number of positions of the first record while reading
+        # with processes > 1, byte ranges of the file are parsed in a process pool (None uses every core)
+        # select, stride and sample drop records before they are tokenized (see _select_records)
+        #     a select callable must be picklable to be used with processes > 1
+        printrow   = lambda x: sys.stderr.write('Importing Row : %s\r' % (1+x))
         reporter   = lambda x: None if quiet else printrow(x)
-        exceeded   = lambda x: x == max_seqs - 1
-        reader     = read_fasta(infile)
-        names, aln = [], []
+        processes  = os.cpu_count() if processes is None else processes
         
-        for n, (name, seq) in enumerate(reader):
-            names += [name]
-            aln   += [vectorize_aligned_sequence(seq, flanking=flanking)]
-            if n % 1000 == 999:
-                reporter(n)
-            if exceeded(n):
-                break
-        reporter(n)
-        
-        names = np.array(names, dtype=object)
-        
-        if remove_unused_cols:
-            is_empty = lambda x: all(i=='' for i in x)
-            index    = {i for i, j in enumerate(map(is_empty,zip(*aln))) if not j}
-            aln_T    = [j for i, j in enumerate(zip(*aln)) if i in index]
-            aln      = np.array(aln_T, dtype=object).T
+        splittable = type(infile)==str and os.path.isfile(infile) and fasta_compression(infile) is None
+        if processes > 1 and splittable and max_seqs < 0 and stride==1 and sample is None:
+            names, aln, bad = _encode_parallel(infile, processes, flanking=flanking, select=select, reporter=reporter)
         else:
-            aln      = np.array(aln, dtype=object)
-        
-        return names, aln
+            reader = _select_records(read_fasta_bytes(infile, decode=False), select, stride, sample, seed)
+            names, buf, bad = _encode_records(reader, flanking=flanking, max_seqs=max_seqs, reporter=reporter)
+            aln = None if buf is None or bad is not None else buf.finish()
+        _check_records(infile, aln, bad)
+        return np.array(names, dtype=object), aln
+    
+    params = {k: v for k, v in kwargs.items() if k not in ('quiet', 'processes')}
+    if store is not None and type(infile)!=str:
+        raise Exception('Alignment containers can only be kept for input files, not streams')
+    store  = infile + '.hbaln' if store is True else store
+    if store is not None and store_is_current(store, infile, params):
+        headers, aln = open_store(store)
+        return headers, _finish_array(aln, encode, **params)
     
-    fast_check(infile)
     names, aln = parse_file(infile, **kwargs)
-    return SequenceHeaders(names), AlignmentArray(aln)
+    if store is not None:
+        write_store(store, SequenceHeaders(names), aln, source=infile, params=params)
+    return SequenceHeaders(names), _finish_array(aln, encode, **params)
+
+def gen_featurized_array(infile, tracks=None, values=None, flanking=True, max_seqs=-1):
+    """
+    reads a feature-linked cfa file into (SequenceHeaders, AlignmentArrayFeaturized)
+    infile : cfa filename or open handle; the first line of each record is the aligned sequence,
+             every following line is a feature line of the same length
+    tracks : names of the feature lines, "feature0", "feature1", ... by default
+    values : {track: {char: value} or string of chars for 0, 1, 2 ...}; these tracks are stored as float32
+    the residues follow the encoded column layout of gen_array(encode=True), the tracks follow the residues
+    """
+    table   = residue_table()
+    values  = {} if values is None else values
+    names   = []
+    buf     = None
+    for n, (name, lines) in enumerate(read_cfa(infile)):
+        if buf is None:
+            tracks = [f'feature{i}' for i in range(len(lines)-1)] if tracks is None else list(tracks)
+        if len(lines)-1!=len(tracks):
+            raise Exception(f'Input file "{infile}": record {1+n} "{name}" has {len(lines)-1} feature lines instead of {len(tracks)}')
+        try:
+            match, sizes, inserts, features = tokenize_tracks(lines[0], lines[1:], flanking=flanking)
+        except Exception as e:
+            raise Exception(f'Input file "{infile}": record {1+n} "{name}", {e}')
+        if buf is None:
+            buf  = EncodedBuffer(len(match))
+            bufs = [EncodedBuffer(len(match)) for _ in tracks]
+        if len(match)!=buf.npos:
+            raise Exception(f'Input file "{infile}" does not seem properly aligned: '
+                            f'record {1+n} "{name}" has {len(match)} positions instead of {buf.npos}')
+        names += [name]
+        buf.append(table[match], sizes, inserts.tobytes())
+        for b, (feature_match, feature_inserts) in zip(bufs, features):
+            b.append(feature_match, sizes, feature_inserts.tobytes())
+        if n == max_seqs - 1:
+            break
+    if buf is None:
+        raise Exception(f'Input file "{infile}" does not contain any sequences')
+    
+    aln     = buf.finish()
+    parts   = [b.finish() for b in bufs]
+    codes   = {k: np.asarray(v.view(np.ndarray)) for k, v in zip(tracks, parts)}
+    inserts = {k: v.inserts for k, v in zip(tracks, parts)}
+    aln     = AlignmentArrayFeaturized(aln.view(np.ndarray), aln.inserts, tracks=codes, track_inserts=inserts)
+    for k in values:
+        aln.tracks[k] = aln.feature_values(k, values[k])
+    return SequenceHeaders(np.array(names, dtype=object)), aln
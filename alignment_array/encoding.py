@@ -0,0 +1,67 @@
+import numpy as np
+
+"""
+    residue encoding used by the encoded alignment arrays
+    codes 0-20 follow AMINO so that code matrices can be counted directly
+    the remaining uppercase letters are appended so that round trips are lossless
+    every other byte (rare symbols like '*' or '.') keeps a code of its own after them, so decoding is byte exact
+    CODES lists the character of every code; tables that only cover RESIDUES use fold_unknown to see those as X
+"""
+
+AMINO    = 'ARNDCQEGHILKMFPSTWYV-'
+RESIDUES = AMINO + 'BJOUXZ'
+UNKNOWN  = RESIDUES.index('X')
+CODES    = RESIDUES + ''.join(chr(i) for i in range(256) if chr(i) not in RESIDUES)
+
+def residue_table(alphabet=RESIDUES, default=None):
+    # returns a 256 entry lookup table from byte value to residue code
+    # bytes outside alphabet get their code in CODES unless a default is given (e.g. UNKNOWN)
+    table = byte_table(CODES).astype(np.uint8) if default is None else np.full(256, default, dtype=np.uint8)
+    table[np.frombuffer(alphabet.encode(), dtype=np.uint8)] = np.arange(len(alphabet))
+    return table
+
+def encode_residues(ndarray, alphabet=RESIDUES):
+    # returns uint8 codes for an array of single character strings; characters beyond one byte are stored as X
+    table = residue_table(alphabet)
+    chars = np.asarray(ndarray, dtype='U1').view(np.uint32).reshape(np.shape(ndarray))
+    return np.where(chars < 256, table[np.minimum(chars, 255)], np.uint8(UNKNOWN))
+
+def decode_residues(codes, alphabet=CODES):
+    # returns an object array of single character strings for an array of codes
+    return np.array(list(alphabet), dtype=object)[codes]
+
+def fold_unknown(codes):
+    # returns codes with every byte outside RESIDUES seen as X, for lookup tables that only cover RESIDUES
+    codes = np.asarray(codes)
+    return codes if codes.max(initial=0) < len(RESIDUES) else np.where(codes < len(RESIDUES), codes, np.uint8(UNKNOWN))
+
+def byte_table(alphabet, default=None):
+    # returns a 256 entry lookup table from byte value to the index of that character in alphabet
+    # other bytes are sent to len(alphabet) unless another default is given
+    table = np.full(256, len(alphabet) if default is None else default, dtype=np.intp)
+    table[np.frombuffer(alphabet.encode('latin-1'), dtype=np.uint8)] = np.arange(len(alphabet))
+    return table
+
+def alphabet_table(alphabet, default=None):
+    # returns a lookup table from residue code to the index of that residue in alphabet
+    # residues missing from alphabet are sent to len(alphabet) unless another default is given
+    default = len(alphabet) if default is None else default
+    return np.array([alphabet.find(i) if i in alphabet else default for i in CODES], dtype=np.intp)
+
+def count_residues(codes, alphabet=AMINO, weights=None, block_size=2**22, table=None):
+    # returns the (weighted) number of occurences of each letter in alphabet at each column
+    # single pass: each block of rows is turned into flat (letter, column) bins for np.bincount
+    # integer counts without weights; float counts with one weight per row
+    # table maps codes to letters of alphabet (len(alphabet) for none), residue codes by default
+    alphabet   = ''.join(alphabet)
+    codes      = np.asarray(codes)
+    nrow, ncol = codes.shape
+    table      = alphabet_table(alphabet) if table is None else table
+    nbins      = (1+len(alphabet)) * ncol
+    step       = max(1, block_size // max(1, ncol))
+    F          = np.zeros(nbins, dtype=int if weights is None else float)
+    for i in range(0, nrow, step):
+        block  = table[codes[i:i+step]] * ncol + np.arange(ncol)
+        w      = None if weights is None else np.repeat(np.asarray(weights, dtype=float)[i:i+step], ncol)
+        F     += np.bincount(block.ravel(), weights=w, minlength=nbins)
+    return F.reshape(1+len(alphabet), ncol)[:-1]
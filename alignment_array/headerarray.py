@@ -1,71 +1,342 @@
+import re
+
 import numpy as np
+import pandas as pd
+
+from .ragged import _ragged_index
+
+def _septag(name, div='=:'):
+    # splits a header into the leading words and one part per tag (words containing "=" or ":")
+    div  = frozenset(i for i in div)
+    out  = [[]]
+    for i in name.split(' '):
+        if not any(s in i for s in div):
+            out[-1] += [i]
+        else:
+            out     += [[i]]
+    return [' '.join(i) for i in out]
+
+_TAGGED = re.compile(r'(?:^| )[^ ]*[=:]')
+_TAG    = lambda x: re.compile(r'(?:^| )' + re.escape(x) + r'(.*?)(?= [^ ]*[=:]|$)')
+_TAGS   = {k: _TAG(k+'=') for k in ['OS','OX','GN','PE','SV','profile']}
+
+def header_fields(name, fields=None):
+    # returns the fields SequenceHeaders would parse (tags "up" and "rf") for a single header
+    # used to filter records while they are read, so only the requested fields are parsed
+    fields = ['names','id','name','accession','OS','OX','GN','PE','SV','profile'] if fields is None else fields
+    tagged = _TAGGED.search(name)
+    head   = (name if tagged is None else name[:tagged.start()]).split(' ',1) + ['']
+    out    = {}
+    for field in fields:
+        if field in ('OS','OX','GN','PE','SV'):
+            value = _TAGS[field].search(name)
+            out[field] = '' if value is None else value.group(1)
+        elif field=='profile':
+            value = _TAGS[field].findall(name)
+            out[field] = value[-1] if len(value) else ''
+        elif field=='accession':
+            out[field] = head[0].split('|')[1] if '|' in head[0] else head[0]
+        else:
+            out[field] = {'names':name, 'id':head[0], 'name':head[1]}[field]
+    return out
+
+def header_predicate(select):
+    """
+    returns a function of a header (str) that tells whether a record is kept
+    select : regex (str or compiled), searched in the whole header
+             dict {field: regex} over header_fields, every field must match
+             callable, called with the dict of header_fields
+    """
+    if select is None:
+        return lambda x: True
+    if isinstance(select, (str, re.Pattern)):
+        return re.compile(select).search
+    if isinstance(select, dict):
+        tests = {k: re.compile(v).search for k, v in select.items()}
+        match = lambda f: all(bool(t(f[k])) for k, t in tests.items())
+        return lambda x: match(header_fields(x, list(tests)))
+    return lambda x: bool(select(header_fields(x)))
+
+_UNIPROT = ('OS','OX','GN','PE','SV')
+_COLUMNS = ['id','name','accession'] + list(_UNIPROT)
+_first   = lambda x: np.flatnonzero(np.r_[True, x[1:]!=x[:-1]][:len(x)])
+_last    = lambda x: np.flatnonzero(np.r_[x[1:]!=x[:-1], True][:len(x)])
+
+def _header_groups(names):
+    """
+    splits every header into the groups of _septag with one scan over all of them
+    headers are joined into one byte buffer and cut into words at spaces; the head is everything before the first
+    word with "=" or ":", and each such word starts a group that runs until the next one, so values keep their
+    spaces (OS=Homo sapiens)
+    returns {"buffer", "head": (start, end) per header, "groups": (start, end, row) of every group in file order,
+    heads included}, all as byte offsets into buffer
+    """
+    if len(names)==0:
+        empty  = np.zeros(0, dtype=np.int64)
+        return {'buffer':b'', 'head':(empty, empty), 'groups':(empty, empty, empty)}
+    buffer     = '\n'.join(names).encode()
+    size       = len(buffer)
+    b          = np.frombuffer(buffer, dtype=np.uint8)
+    newline    = np.flatnonzero(b==10)
+    line_start = np.r_[0, newline+1]
+    line_end   = np.r_[newline, size]
+    word_start = np.r_[0, np.flatnonzero((b==10) | (b==32)) + 1]
+    marks      = np.flatnonzero((b==61) | (b==58))
+    
+    # tags end one byte before the next tag of the same header, or at the end of the header
+    words      = np.searchsorted(word_start, marks, 'right') - 1
+    tags       = word_start[words[_first(words)]]
+    line       = np.searchsorted(line_start, tags, 'right') - 1
+    tag_end    = np.where(np.r_[line[1:]==line[:-1], False], np.r_[tags[1:], 0] - 1, line_end[line])
+    idx        = _first(line)
+    head_end   = line_end.copy()
+    head_end[line[idx]] = np.maximum(tags[idx] - 1, line_start[line[idx]])
+    
+    # each head goes before the tags of its header
+    rows       = np.arange(len(line_start))
+    place      = np.r_[rows + np.searchsorted(line, rows), np.arange(len(tags)) + line + 1]
+    groups     = [np.empty(len(place), dtype=np.int64) for _ in range(3)]
+    for out, x in zip(groups, [np.r_[line_start, tags], np.r_[head_end, tag_end], np.r_[rows, line]]):
+        out[place] = x
+    return {'buffer':buffer, 'head':(line_start, head_end), 'groups':tuple(groups)}
+
+def _prefix_spans(scan, prefix, last=True):
+    # returns (rows, start, end) of what follows prefix in the last (or first) group of each header that starts with it
+    start, end, row = scan['groups']
+    b       = np.frombuffer(scan['buffer'], dtype=np.uint8)
+    prefix  = np.frombuffer(prefix.encode(), dtype=np.uint8)
+    sel     = np.flatnonzero(end - start >= len(prefix))
+    for j, c in enumerate(prefix):
+        sel = sel[b[start[sel]+j]==c]
+    sel     = sel[(_last if last else _first)(row[sel])]
+    return row[sel], start[sel] + len(prefix), end[sel]
+
+def _uniprot_spans(scan):
+    # returns {column: spans} for parse_uniprot; (start, end) per header for id, name and accession,
+    # (rows, start, end) for the first occurrence of each tag
+    b          = np.frombuffer(scan['buffer'], dtype=np.uint8)
+    head_start, head_end = scan['head']
+    after      = lambda x, y: np.r_[x, len(b)][np.searchsorted(x, y)]
+    id_end     = np.minimum(after(np.flatnonzero(b==32), head_start), head_end)
+    pipes      = np.flatnonzero(b==124)
+    pipe       = after(pipes, head_start)
+    piped      = pipe < id_end
+    spans      = {'id'        : (head_start, id_end),
+                  'name'      : (np.minimum(id_end+1, head_end), head_end),
+                  'accession' : (np.where(piped, pipe+1, head_start),
+                                 np.where(piped, np.minimum(after(pipes, pipe+1), id_end), id_end))}
+    for tag in _UNIPROT:
+        spans[tag] = _prefix_spans(scan, tag+'=', last=False)
+    return spans
+
+def _cut(buffer, text, starts, ends):
+    # returns the substrings at byte offsets (start, end) as an object array
+    # offsets are only valid in the str when every character is one byte, otherwise slices of the buffer are decoded
+    pairs = zip(starts.tolist(), ends.tolist())
+    out   = [text[a:e] for a, e in pairs] if len(text)==len(buffer) else [buffer[a:e].decode() for a, e in pairs]
+    return np.array(out, dtype=object)
+
+def _span_ints(buffer, starts, ends):
+    # returns the decimal numbers at byte offsets (start, end); spans that are not a number give 0
+    b      = np.frombuffer(buffer, dtype=np.uint8)
+    length = ends - starts
+    valid  = (length > 0) & (length < 10)
+    out    = np.zeros(len(starts), dtype=np.int64)
+    for k in range(int(length[valid].max()) if valid.any() else 0):
+        live   = valid & (k < length)
+        digit  = b[np.where(live, starts+k, 0)].astype(np.int64) - 48
+        valid &= ~live | ((digit >= 0) & (digit <= 9))
+        out    = np.where(live, 10*out + digit, out)
+    return np.where(valid, out, 0)
+
+class HeaderIndex:
+    """
+        hash index from the values of a header column to the rows that hold them
+        values are factorized once; rows are grouped by value so every lookup is vectorized
+            lookup(keys) : first row of each key, -1 when it is missing
+            rows(keys)   : (key positions, rows) of every match, for values found in several rows
+            isin(keys)   : mask of the rows whose value is one of keys (semi-join)
+    """
+    def __init__(self, values):
+        codes, uniques = pd.factorize(values)
+        self.codes     = codes
+        self.values    = pd.Index(uniques)
+        self.order     = np.argsort(codes, kind='stable')
+        self.offsets   = np.searchsorted(codes[self.order], np.arange(len(uniques)+1))
+    
+    def __repr__(self):
+        return '<HeaderIndex: %s rows, %s values>' % (len(self.codes), len(self.values))
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def _keys(self, keys):
+        # returns the value number of each key, -1 when it is missing
+        return self.values.get_indexer(np.asarray(keys, dtype=object) if isinstance(keys, (list, tuple)) else keys)
+    
+    def lookup(self, keys):
+        found = self._keys(keys)
+        return np.where(found >= 0, self.order[self.offsets[np.maximum(found, 0)]], -1)
+    
+    def rows(self, keys):
+        found  = self._keys(keys)
+        starts = self.offsets[np.maximum(found, 0)]
+        counts = np.where(found >= 0, self.offsets[np.maximum(found, 0)+1] - starts, 0)
+        return np.repeat(np.arange(len(found)), counts), self.order[_ragged_index(starts, counts)]
+    
+    def isin(self, keys):
+        # hit has one extra False entry, so rows without a value (code -1) are never selected
+        found = self._keys(keys)
+        hit   = np.zeros(len(self.values)+1, dtype=bool)
+        hit[found[found >= 0]] = True
+        return hit[self.codes]
 
 class SequenceHeaders(dict):
+    """
+        columns parsed from the sequence headers in "names"
+        columns are parsed on first access and kept, several at a time with one scan over the headers:
+            id, name, accession, OS, OX, GN, PE, SV : parse_uniprot
+            profile                                 : parse_profiles
+            prefixes given in query                 : parse_query, every pending prefix in the same scan
+        tags ("up", "rf") and query only declare columns, nothing is parsed until a column is used
+        declared columns are keys like parsed ones ("OS" in headers, keys(), dict(headers), pd.DataFrame(headers));
+        reading their values (items(), values(), get()) parses them
+    any column can be indexed to find rows by value (see HeaderIndex), e.g. to subset an alignment by accessions
+        aln[headers.isin('accession', accessions)]
+    """
     def __init__(self, names, tags=[], query=[]):
-        self['names'] = names
-        if 'up' in tags:
-            self.parse_uniprot()
+        self._indexes  = {}
+        self['names']  = names
+        # pending columns map to their prefix, or None for the uniprot columns
+        self._pending  = {k: None for k in (_COLUMNS if 'up' in tags else [])}
+        self._pending.update({q: q for q in query})
         if 'rf' in tags:
-            self.parse_profiles()
-        for q in query:
-            self.parse_query(q)
+            self._pending['profile'] = 'profile='
     
     def __repr__(self):
-        x = (len(self), 's' if len(self)>1 else '', '","'.join(self))
+        keys = self.keys()
+        x    = (len(keys), 's' if len(keys)>1 else '', '","'.join(keys))
         return '<SequenceHeaders: %s tag%s; ("%s")>' % x
     
+    def __setitem__(self, key, value):
+        # new headers make every parsed column stale, a new column its index; a column set by hand is no longer pending
+        indexes = getattr(self, '_indexes', {})
+        if key=='names':
+            self.clear()
+            indexes.clear()
+        indexes.pop(key, None)
+        getattr(self, '_pending', {}).pop(key, None)
+        super().__setitem__(key, value)
+    
+    def __missing__(self, key):
+        if key in _COLUMNS:
+            self.parse_uniprot()
+        elif key=='profile' or key in self._pending:
+            prefixes = {k: v for k, v in self._pending.items() if v is not None}
+            self._parse_prefixes(dict(prefixes, **({'profile':'profile='} if key=='profile' else {})))
+        else:
+            raise KeyError(key)
+        return super().__getitem__(key)
+    
+    #################################################################################
+    #####  mapping over parsed and pending columns                              #####
+    #################################################################################
+    
+    def __contains__(self, key):
+        return super().__contains__(key) or key in getattr(self, '_pending', {})
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self):
+        return len(self.keys())
+    
+    def keys(self):
+        return list(super().keys()) + [k for k in getattr(self, '_pending', {}) if not dict.__contains__(self, k)]
+    
+    def values(self):
+        return [self[k] for k in self.keys()]
+    
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    #################################################################################
+    #####  columns                                                              #####
+    #################################################################################
+    
     def names(self):
         return self['names']
     
+    def index(self, column):
+        # returns the HeaderIndex of a column, built on first use and kept until the column is replaced
+        if column not in self._indexes:
+            self._indexes[column] = HeaderIndex(self[column])
+        return self._indexes[column]
+    
+    def lookup(self, column, keys):
+        # returns the first row whose column value is each key, -1 when missing
+        return self.index(column).lookup(keys)
+    
+    def isin(self, column, keys):
+        # returns the mask of rows whose column value is one of keys
+        return self.index(column).isin(keys)
+    
     def map_names(self, fxn=None):
-        def septag(name, div='=:'):
-            div  = frozenset(i for i in div)
-            out  = [[]]
-            for i in name.split(' '):
-                if not any(s in i for s in div):
-                    out[-1] += [i]
-                else:
-                    out     += [[i]]
-            return [' '.join(i) for i in out]
-        fxn = septag if fxn==None else fxn
+        fxn = _septag if fxn==None else fxn
         for name in self.names():
             yield fxn(name)
     
-    def parse_uniprot(self):
-        for tag in ['id','name','OS','OX','GN','PE','SV']:
-            self[tag] = []
-        split = lambda x: x.split(' ',1) if ' ' in x else [x,'']
-        for name in self.map_names():
-            head = split(name.pop(0))
-            self['id'  ] += [head.pop(0)]
-            self['name'] += [head.pop(0)]
-            for tag in ['OS','OX','GN','PE','SV']:
-                try:
-                    self[tag] += [next(filter(lambda x: x.startswith(tag+'='), name))[3:]]
-                except:
-                    self[tag] += ['']
-                    
-        self['accession'] = np.array([x.split('|')[1] for x in  self['id']], dtype=object)
-        for tag in ['id','name','OS','OX','GN','PE','SV']:
-            self[tag] = np.array(self[tag], dtype=object)
+    def parse_uniprot(self, compact=True, table=None):
+        """
+        fills the uniprot columns id, name, accession, OS, OX, GN, PE and SV from every header in one scan
+        compact : OS and OX become pandas Categoricals and PE and SV int32 (0 when missing),
+                  otherwise every column is an object array of strings ('' when missing)
+        table   : None, "pandas" or "arrow"; also returns the columns as a DataFrame or a pyarrow Table
+        """
+        n      = len(self.names())
+        scan   = _header_groups(self.names())
+        spans  = _uniprot_spans(scan)
+        buffer = scan['buffer']
+        text   = buffer.decode()
+        for tag in ['id','name','accession']:
+            self[tag] = _cut(buffer, text, *spans[tag])
+        for tag in _UNIPROT:
+            rows, starts, ends = spans[tag]
+            if compact and tag in ('PE','SV'):
+                self[tag] = np.zeros(n, dtype=np.int32)
+                self[tag][rows] = _span_ints(buffer, starts, ends)
+                continue
+            self[tag] = np.full(n, '', dtype=object)
+            self[tag][rows] = _cut(buffer, text, starts, ends)
+            if compact and tag in ('OS','OX'):
+                self[tag] = pd.Categorical(self[tag])
+        
+        if table=='pandas':
+            return pd.DataFrame({k: self[k] for k in _COLUMNS})
+        if table=='arrow':
+            import pyarrow as pa
+            return pa.Table.from_pandas(pd.DataFrame({k: self[k] for k in _COLUMNS}), preserve_index=False)
+        if table is not None:
+            raise Exception(f'table must be None, "pandas" or "arrow", not {table!r}')
         
+    def _parse_prefixes(self, columns):
+        # fills {column: prefix} with one scan; each value is what follows the prefix in the last group of the
+        # header that starts with it (see _septag), () when there is none
+        scan = _header_groups(self.names())
+        text = scan['buffer'].decode()
+        for key, prefix in columns.items():
+            rows, starts, ends = _prefix_spans(scan, prefix)
+            column = np.empty(len(self.names()), dtype=object)
+            column.fill(())
+            column[rows] = _cut(scan['buffer'], text, starts, ends)
+            self[key] = column
+    
     def parse_profiles(self):
-        self['profile'] = []
-        for name in self.map_names():
-            try:
-                name = tuple(i[8:] for i in filter(lambda x: x.startswith('profile='), name))
-                self['profile'] += [name[-1]]
-            except:
-                self['profile'] += [()]
-        self['profile'] = np.array(self['profile'], dtype=object)
-
-    def parse_query(self, prefix):
-        self[prefix] = []
-        for name in self.map_names():
-            try:
-                lp   = len(prefix)
-                name = tuple(i[lp:] for i in filter(lambda x: x.startswith(prefix), name))
-                self[prefix] += [name[-1]]
-            except:
-                self[prefix] += [()]
-        self[prefix] = np.array(self[prefix], dtype=object)
+        self._parse_prefixes({'profile':'profile='})
+    
+    def parse_query(self, *prefixes):
+        # several prefixes are extracted in the same scan; each column is named after its prefix
+        self._parse_prefixes({q: q for q in prefixes})
@@ -0,0 +1,136 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+"""
+    blocked pairwise identity engine over encoded match columns
+    identity between two sequences is the number of identical columns (gaps included) over all columns
+
+    rows are one hot encoded one block at a time so that each tile is a single float32 matrix product
+    blocks of query rows are handed to a thread pool (the matrix products release the gil)
+    memory is bounded by the block size, which is derived from a memory budget, never by the number of sequences
+        pairwise_identity  : full (nquery, ntarget) matrix, optionally written to a .npy memmap on disk
+        identity_neighbors : top k most similar targets for every query
+        identity_pairs     : all pairs at or above an identity threshold
+        identity_counts    : number of targets at or above an identity threshold for every query
+    when no target is given the query is compared against itself and self hits are skipped where relevant
+"""
+
+def onehot(codes, nstates):
+    # returns float32 one hot rows (nrow, ncol*nstates); dot products count identical columns
+    codes      = np.asarray(codes)
+    nrow, ncol = codes.shape
+    out        = np.zeros((nrow, ncol*nstates), dtype=np.float32)
+    out[np.arange(nrow)[:,None], np.arange(ncol)*nstates + codes] = 1
+    return out
+
+def _setup(query, target, block_size, threads, memory):
+    # resolves the target, thread count and the number of rows per block
+    query   = np.asarray(query)
+    target  = query if target is None else np.asarray(target)
+    assert query.shape[1]==target.shape[1], 'query and target must have the same number of columns'
+    nstates = 1 + int(max(query.max(initial=0), target.max(initial=0)))
+    threads = os.cpu_count() if threads is None else threads
+    if block_size is None:
+        row        = 4 * query.shape[1] * nstates
+        block_size = int(np.clip(memory // max(1, threads) // (2*row), 16, 4096))
+    return query, target, nstates, threads, block_size
+
+def _run(query, target, fxn, nstates, threads, block_size, upper=False):
+    # calls fxn(i, tiles) for every block of query rows in a thread pool; results are returned in order
+    # tiles yields (j, tile) where tile[a,b] counts identical columns between query i+a and target j+b
+    # with upper, only tiles on or above the diagonal are computed (for comparing against itself)
+    def tiles(i):
+        X = onehot(query[i:i+block_size], nstates)
+        for j in range(i if upper else 0, target.shape[0], block_size):
+            Y = onehot(target[j:j+block_size], nstates)
+            yield j, X @ Y.T
+    with ThreadPoolExecutor(max(1, threads)) as pool:
+        return list(pool.map(lambda i: fxn(i, tiles(i)), range(0, query.shape[0], block_size)))
+
+def _cutoff(threshold, ncol):
+    # smallest number of identical columns that reaches the identity threshold
+    return np.ceil(threshold * ncol - 1e-9)
+
+def pairwise_identity(query, target=None, out=None, block_size=None, threads=None, memory=2**28):
+    # returns the (nquery, ntarget) float32 identity matrix
+    # out may be an array to fill or a filename for a .npy memmap (reopen with np.load(out, mmap_mode='r'))
+    query, target, nstates, threads, block_size = _setup(query, target, block_size, threads, memory)
+    shape = (query.shape[0], target.shape[0])
+    if type(out)==str:
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=shape)
+    elif out is None:
+        out = np.zeros(shape, dtype=np.float32)
+    ncol = max(1, query.shape[1])
+    def fill(i, tiles):
+        for j, tile in tiles:
+            out[i:i+tile.shape[0],j:j+tile.shape[1]] = tile / ncol
+    _run(query, target, fill, nstates, threads, block_size)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+def identity_neighbors(query, target=None, k=10, block_size=None, threads=None, memory=2**28):
+    # returns (indices, identities) of the k most similar targets for each query, most similar first
+    self_hits = target is None
+    query, target, nstates, threads, block_size = _setup(query, target, block_size, threads, memory)
+    k    = min(k, target.shape[0] - self_hits)
+    ncol = max(1, query.shape[1])
+    def best(i, tiles):
+        nrow  = len(query[i:i+block_size])
+        value = np.zeros((nrow, 0), dtype=np.float32)
+        index = np.zeros((nrow, 0), dtype=int)
+        for j, tile in tiles:
+            tile = tile / ncol
+            if self_hits:
+                rows = np.arange(nrow)
+                cols = rows + i - j
+                diag = (cols>=0) & (cols<tile.shape[1])
+                tile[rows[diag], cols[diag]] = -1
+            cols  = np.broadcast_to(np.arange(j, j+tile.shape[1]), tile.shape)
+            value = np.concatenate((value, tile), axis=1)
+            index = np.concatenate((index, cols), axis=1)
+            if value.shape[1] > k:
+                keep  = np.argpartition(-value, k-1, axis=1)[:,:k]
+                value = np.take_along_axis(value, keep, axis=1)
+                index = np.take_along_axis(index, keep, axis=1)
+        order = np.argsort(-value, axis=1, kind='stable')[:,:k]
+        return np.take_along_axis(index, order, axis=1), np.take_along_axis(value, order, axis=1)
+    blocks = _run(query, target, best, nstates, threads, block_size)
+    if len(blocks)==0:
+        return np.zeros((0, k), dtype=int), np.zeros((0, k), dtype=np.float32)
+    return tuple(np.concatenate(i) for i in zip(*blocks))
+
+def identity_pairs(query, target=None, threshold=0.8, block_size=None, threads=None, memory=2**28):
+    # returns (query rows, target rows, identities) of every pair at or above threshold
+    # when comparing against itself, each pair is reported once with query row < target row
+    self_hits = target is None
+    query, target, nstates, threads, block_size = _setup(query, target, block_size, threads, memory)
+    ncol   = max(1, query.shape[1])
+    cutoff = _cutoff(threshold, query.shape[1])
+    def pairs(i, tiles):
+        found = []
+        for j, tile in tiles:
+            a, b = np.nonzero(tile >= cutoff)
+            if self_hits:
+                keep = a+i < b+j
+                a, b = a[keep], b[keep]
+            found += [(a+i, b+j, tile[a, b] / ncol)]
+        return found
+    found = [j for i in _run(query, target, pairs, nstates, threads, block_size, upper=self_hits) for j in i]
+    if len(found)==0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+    return tuple(np.concatenate(i) for i in zip(*found))
+
+def identity_counts(query, target=None, threshold=0.8, block_size=None, threads=None, memory=2**28):
+    # returns the number of targets at or above threshold for each query (a query counts itself)
+    query, target, nstates, threads, block_size = _setup(query, target, block_size, threads, memory)
+    cutoff = _cutoff(threshold, query.shape[1])
+    def count(i, tiles):
+        n = np.zeros(len(query[i:i+block_size]), dtype=int)
+        for j, tile in tiles:
+            n += (tile >= cutoff).sum(1)
+        return n
+    blocks = _run(query, target, count, nstates, threads, block_size)
+    return np.concatenate(blocks) if len(blocks) else np.zeros(0, dtype=int)
@@ -5,6 +5,8 @@ from itertools import groupby
 
 import numpy as np
 
+from .writers import write_psicov
+
 class Potts:
     def __init__(self):
         self.couplings = None
@@ -13,7 +15,7 @@ class Potts:
         if type(self.couplings)!=np.ndarray:
             return f'< Potts: no data >'
         else:
-            return f'< Potts: size={self.couplings.shape}, nseq={self.nseqs} >'
+            return f'< Potts: size={self.couplings.shape}, nseq={self.nseqs}, neff={self.neff:.1f} >'
     
     def get_fn_apc(self, H):
         # calculate frobenius norm
@@ -30,9 +32,15 @@ class Potts:
         
         return fn, fn_apc
     
-    def from_ccmpred(self, AlignmentArray, bin='ccmpred', n=5000, e=0.01):
+    def from_ccmpred(self, AlignmentArray, bin='ccmpred', n=5000, e=0.01, weights=None, threshold=0.8):
+        # ccmpred only reads the sequences and does its own identity reweighting, so weights can only be
+        #     None       : ccmpred defaults, no weights are kept
+        #     'identity' : ccmpred reweighting at threshold identity (-w), kept as sequence_weights('identity', threshold)
+        # other methods or weight vectors can not be passed to ccmpred and raise
         if type(self.couplings)==np.ndarray:
             raise Exception('refusing to overwrite existing model')
+        if weights is not None and not (type(weights)==str and weights=='identity'):
+            raise Exception('ccmpred only applies its own identity reweighting; use weights=None or "identity"')
 
         char        = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
         rand        = ''.join(np.random.choice(list(char), 6))
@@ -43,10 +51,8 @@ class Potts:
         file_params = f'ccmpred_{rand}.potts'
         
         try:
-            with open(file_psicov, 'w') as w:
-                for sequence in A:
-                    w.write(''.join(sequence)+'\n')
-            cmd = f'{bin} -n {n} -e {e} -r {file_params} {file_psicov} {file_fn_apc}'
+            write_psicov(file_psicov, A)
+            cmd = f'{bin} -n {n} -e {e}' + (f' -w {threshold}' if weights else '') + f' -r {file_params} {file_psicov} {file_fn_apc}'
             sys.stderr.write(f'{cmd}\n')
             call(cmd.split())
             
@@ -77,6 +83,8 @@ class Potts:
             
             self.nsites    = A.shape[1]
             self.nseqs     = A.shape[0]
+            self.weights   = None if weights is None else A.sequence_weights(weights, threshold=threshold)
+            self.neff      = self.nseqs if self.weights is None else float(np.sum(self.weights))
             self.couplings = couplings
             self.fields    = fields
             
@@ -93,7 +101,9 @@ class Potts:
     def dump(self, filename):
         if type(self.couplings)!=np.ndarray:
             raise Exception('no data to save')
-        data = {'couplings':self.couplings, 'fields':self.fields, 'nseqs':self.nseqs, 'states':self.states}
+        data = {'couplings':self.couplings, 'fields':self.fields, 'nseqs':self.nseqs, 'states':self.states, 'neff':self.neff}
+        if self.weights is not None:
+            data['weights'] = self.weights
         np.savez_compressed(filename, **data)
         
     def load(self, filename):
@@ -105,6 +115,8 @@ class Potts:
         self.fields    = data['fields']     # h i Si
         self.nseqs     = data['nseqs']
         self.states    = data['states']
+        self.neff      = data['neff'] if 'neff' in data else self.nseqs
+        self.weights   = data['weights'] if 'weights' in data else None
         self.nsites    = self.couplings.shape[0]
         self.fn, self.fn_apc = self.get_fn_apc(self.couplings)
         return self
@@ -0,0 +1,186 @@
+import numpy as np
+
+from .encoding import CODES
+
+"""
+    ragged (offsets + bytes) storage for insert columns of encoded alignments
+    a python str costs ~50 bytes per cell even when empty; here a cell costs one offset
+    insert slots that are empty in every sequence cost nothing at all
+
+        RaggedColumn : one column of strings as an offsets array and one contiguous byte buffer
+        InsertArray  : the (sequences, slots) inserts of an EncodedAlignmentArray, one RaggedColumn per slot
+"""
+
+_LOWER = np.array([0 if i==ord('-') else ord(chr(i).lower()) if i<128 else i for i in range(256)], dtype=np.uint8)
+
+def _offset_dtype(size):
+    # 4 byte offsets unless the buffer is too large for them
+    return np.int32 if size < 2**31 else np.int64
+
+def _ragged_index(starts, sizes):
+    # returns the concatenation of arange(start, start+size) for every (start, size) pair
+    total = int(sizes.sum())
+    return np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(total)
+
+class RaggedColumn:
+    """
+        one column of strings: row i is buffer[offsets[i]:offsets[i+1]]
+        offsets index directly into buffer so that both can be views into a memory-mapped file
+    """
+    def __init__(self, offsets, buffer):
+        self.offsets = offsets
+        self.buffer  = buffer
+
+    def __repr__(self):
+        return '<RaggedColumn: %s rows, %s bytes>' % (len(self), self.offsets[-1]-self.offsets[0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def empty(cls, nrow):
+        return cls(np.zeros(nrow+1, dtype=np.int32), np.zeros(0, dtype=np.uint8))
+
+    @classmethod
+    def from_strings(cls, strings, encoding='ascii'):
+        # builds a column from an array of python strings
+        # offsets count bytes, so strings are measured again once encoded when any character takes several bytes
+        sizes   = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+        buffer  = np.frombuffer(''.join(strings).encode(encoding), dtype=np.uint8)
+        if len(buffer)!=sizes.sum():
+            sizes = np.fromiter((len(i.encode(encoding)) for i in strings), dtype=np.int64, count=len(strings))
+        offsets = np.r_[0, np.cumsum(sizes)].astype(_offset_dtype(len(buffer)))
+        return cls(offsets, buffer)
+
+    @classmethod
+    def from_codes(cls, codes, alphabet=CODES):
+        # builds an insert column out of one encoded position; residues are lowercased and gaps dropped
+        chars   = _LOWER[np.frombuffer(alphabet.encode('latin-1'), dtype=np.uint8)][np.asarray(codes)]
+        offsets = np.r_[0, np.cumsum(chars!=0)].astype(_offset_dtype(len(chars)))
+        return cls(offsets, chars[chars!=0])
+
+    @classmethod
+    def join(cls, columns):
+        # concatenates the strings of several columns row by row without materializing them
+        sizes   = [i.lengths() for i in columns]
+        total   = sum(sizes)
+        offsets = np.r_[0, np.cumsum(total)]
+        buffer  = np.empty(offsets[-1], dtype=np.uint8)
+        start   = offsets[:-1].copy()
+        for column, size in zip(columns, sizes):
+            source          = np.arange(column.offsets[0], column.offsets[-1])
+            shift           = np.repeat(start - column.offsets[:-1], size)
+            buffer[source + shift] = column.buffer[source]
+            start          += size
+        return cls(offsets.astype(_offset_dtype(len(buffer))), buffer)
+
+    def lengths(self):
+        # returns the length of the string in each row
+        return np.diff(self.offsets).astype(np.int64)
+
+    def take(self, rows):
+        # returns the column for a subset of rows; contiguous slices share the buffer
+        if type(rows)==slice and rows.step in (None, 1):
+            start, stop, _ = rows.indices(len(self))
+            return RaggedColumn(self.offsets[start:1+max(start, stop)], self.buffer)
+        rows   = np.arange(len(self))[rows]
+        starts = self.offsets[:-1][rows].astype(np.int64)
+        sizes  = self.lengths()[rows]
+        buffer = self.buffer[_ragged_index(starts, sizes)]
+        return RaggedColumn(np.r_[0, np.cumsum(sizes)].astype(_offset_dtype(len(buffer))), buffer)
+
+    def compact(self):
+        # returns (offsets starting at 0, contiguous buffer) for writing to disk
+        offsets = self.offsets.astype(np.int64)
+        return offsets - offsets[0], np.asarray(self.buffer[offsets[0]:offsets[-1]])
+
+    def strings(self, encoding='ascii'):
+        # re-materializes the python strings by slicing the decoded buffer (memory in proportion to the bytes)
+        # slices of the str are only valid when every character is one byte, otherwise each row is decoded
+        offsets = self.offsets.astype(np.int64)
+        buffer  = np.asarray(self.buffer[offsets[0]:offsets[-1]], dtype=np.uint8).tobytes()
+        text    = buffer.decode(encoding)
+        pairs   = zip((offsets[:-1] - offsets[0]).tolist(), (offsets[1:] - offsets[0]).tolist())
+        out     = [text[a:b] for a, b in pairs] if len(text)==len(buffer) else [buffer[a:b].decode(encoding) for a, b in pairs]
+        return np.array(out, dtype=object)
+
+class InsertArray:
+    """
+        inserts of an encoded alignment with shape (sequences, slots)
+        each slot is a RaggedColumn, or None when the slot is empty in every sequence
+        indexing with [rows, slots] returns another InsertArray; slots must be an int, slice or list
+    """
+    def __init__(self, columns, nrow):
+        self.columns = list(columns)
+        self.nrow    = nrow
+
+    def __repr__(self):
+        return '<InsertArray: %s sequences, %s slots (%s used), %s bytes>' % (*self.shape, self.used().sum(), self.nbytes)
+
+    @property
+    def shape(self):
+        return self.nrow, len(self.columns)
+
+    @property
+    def nbytes(self):
+        return sum(i.offsets.nbytes + i.offsets[-1] - i.offsets[0] for i in self.columns if i is not None)
+
+    @classmethod
+    def empty(cls, nrow, nslots):
+        return cls([None]*nslots, nrow)
+
+    @classmethod
+    def from_strings(cls, ndarray):
+        # builds the inserts from a (sequences, slots) array of python strings
+        ndarray = np.asarray(ndarray, dtype=object)
+        build   = lambda x: RaggedColumn.from_strings(x) if any(x) else None
+        return cls([build(ndarray[:,i]) for i in range(ndarray.shape[1])], ndarray.shape[0])
+
+    def __getitem__(self, key):
+        # [rows, slot] returns python strings; [rows, slots] returns another InsertArray
+        rows, cols = ((key if type(key)==tuple else (key,)) + (slice(None),)*2)[:2]
+        rows = [rows] if isinstance(rows, (int, np.integer)) else rows
+        nrow = len(np.arange(self.nrow)[rows])
+        take = lambda x: None if x is None else x.take(rows)
+        if isinstance(cols, (int, np.integer)):
+            return InsertArray([take(self.columns[cols])], nrow).column(0)
+        return InsertArray([take(self.columns[i]) for i in np.arange(len(self.columns))[cols]], nrow)
+
+    def slot(self, i):
+        # returns the RaggedColumn of one slot, empty slots included
+        return RaggedColumn.empty(self.nrow) if self.columns[i] is None else self.columns[i]
+
+    def column(self, i):
+        # returns the python strings of one slot
+        if self.columns[i] is None:
+            return np.full(self.nrow, '', dtype=object)
+        return self.columns[i].strings()
+
+    def strings(self):
+        # returns a (sequences, slots) object array of python strings
+        out = np.full(self.shape, '', dtype=object)
+        for i in np.flatnonzero(self.used()):
+            out[:,i] = self.column(i)
+        return out
+
+    def lengths(self):
+        # returns the (sequences, slots) length of every insert
+        out = np.zeros(self.shape, dtype=np.int64)
+        for i, column in enumerate(self.columns):
+            if column is not None:
+                out[:,i] = column.lengths()
+        return out
+
+    def used(self):
+        # returns which slots have an insert in at least one sequence
+        return np.array([i is not None and i.offsets[-1]>i.offsets[0] for i in self.columns], dtype=bool)
+
+    def frequency(self):
+        # returns the fraction of sequences with an insert at each slot
+        return (self.lengths() > 0).mean(0) if self.nrow else np.zeros(len(self.columns))
+
+    def mean_length(self):
+        # returns the average insert length at each slot among sequences that have an insert there
+        lengths = self.lengths()
+        count   = (lengths > 0).sum(0)
+        return np.divide(lengths.sum(0), count, out=np.zeros(len(self.columns)), where=count>0)
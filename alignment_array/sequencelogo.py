@@ -26,10 +26,11 @@ params = {'title'           : '',
           'logo_font'       : "ArialMT"}
 
 class SequenceLogo:
-    def __init__(self, AlignmentArray):
+    def __init__(self, AlignmentArray, weights=None):
+        # weights: one weight per sequence or the name of a weighting method (see AlignmentArray.sequence_weights)
         A             = AlignmentArray.remove_inserts()
         alphabet      = weblogo.seq.unambiguous_protein_alphabet
-        counts        = np.array([(A==i).sum(0) for i in alphabet]).T
+        counts        = A.counts(''.join(alphabet), weights=weights).T
         self.logodata = weblogo.LogoData.from_counts(alphabet, counts)
         self.nseq, self.npos = A.shape
     
@@ -0,0 +1,119 @@
+import os
+import re
+import json
+
+import numpy as np
+
+from .headerarray import SequenceHeaders
+from .alignmentarray import EncodedAlignmentArray
+from .ragged import RaggedColumn, InsertArray
+
+"""
+    native binary container for encoded alignments, opened lazily thru np.memmap
+
+    layout:
+        8 bytes   : magic (HBALN001)
+        8 bytes   : little endian uint64 size of the json header
+        n bytes   : json header describing each segment (offset, dtype, shape) and the source file
+        segments  : raw arrays, each aligned to 64 bytes
+            codes          : (sequences, positions) uint8 match states (see encoding.py)
+            name_offsets   : (sequences+1) int64 offsets into name_bytes
+            name_bytes     : utf-8 sequence headers
+            insert_used    : (positions+1) bool, insert slots that are not empty in every sequence
+            insert_offsets : (used slots, sequences+1) int64 offsets into insert_bytes
+            insert_bytes   : ascii inserts, one used slot after another
+
+    slicing the code matrix only reads the pages it touches
+    inserts are opened as RaggedColumns over the memory-mapped offsets and bytes (see ragged.py)
+    headers are decoded on open
+"""
+
+MAGIC = b'HBALN001'
+ALIGN = 64
+
+def _source_stamp(source):
+    # identifies a version of the source file by path, modification time and size
+    if source is None or not os.path.isfile(source):
+        return None
+    stat = os.stat(source)
+    return {'path':os.path.abspath(source), 'mtime':stat.st_mtime_ns, 'size':stat.st_size}
+
+def _pattern_repr(x):
+    if isinstance(x, re.Pattern):
+        return repr(x)
+    raise TypeError(f'{type(x).__name__} can not be compared thru json')
+
+def write_store(filename, headers, aln, source=None, params=None):
+    # writes SequenceHeaders and an alignment array (encoded if needed) into a single container
+    # source and params record which file and gen_array options produced it (see store_is_current)
+    aln           = aln.encode()
+    inserts       = aln.inserts if aln.inserts is not None else InsertArray.empty(aln.shape[0], 1+aln.shape[1])
+    used          = inserts.used()
+    name_offsets, name_bytes = RaggedColumn.from_strings(headers['names'], encoding='utf-8').compact()
+    insert_ragged = [inserts.columns[i].compact() for i in np.flatnonzero(used)]
+    insert_offsets = np.array([i[0] for i in insert_ragged], dtype=np.int64).reshape(-1, aln.shape[0]+1)
+    insert_bytes  = np.concatenate([i[1] for i in insert_ragged]) if len(insert_ragged) else np.zeros(0, np.uint8)
+    insert_offsets += np.r_[0, np.cumsum([len(i[1]) for i in insert_ragged])][:-1,None].astype(np.int64)
+    segments      = {'codes'          : np.ascontiguousarray(aln.view(np.ndarray)),
+                     'name_offsets'   : name_offsets,
+                     'name_bytes'     : name_bytes,
+                     'insert_used'    : used,
+                     'insert_offsets' : insert_offsets,
+                     'insert_bytes'   : insert_bytes}
+    header        = {'version':1, 'shape':list(aln.shape), 'source':_source_stamp(source), 'params':params, 'segments':{}}
+
+    # offsets are relative to the end of the json header, so the header can be sized after
+    offset = 0
+    for name, array in segments.items():
+        offset += -offset % ALIGN
+        header['segments'][name] = {'offset':offset, 'dtype':array.dtype.str, 'shape':list(array.shape)}
+        offset += array.nbytes
+    blob = json.dumps(header, default=repr).encode()
+    blob = blob + b' ' * (-(len(MAGIC) + 8 + len(blob)) % ALIGN)
+
+    with open(filename, 'wb') as w:
+        w.write(MAGIC + np.uint64(len(blob)).tobytes() + blob)
+        start = w.tell()
+        for name, array in segments.items():
+            w.write(b'\0' * (start + header['segments'][name]['offset'] - w.tell()))
+            w.write(array.tobytes())
+    return filename
+
+def read_store_header(filename):
+    # returns the json header of a container and the byte offset where its segments start
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC))!=MAGIC:
+            raise Exception(f'"{filename}" is not an alignment container')
+        size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return json.loads(f.read(size)), len(MAGIC) + 8 + size
+
+def store_is_current(filename, source, params=None):
+    # checks that the container exists and was written from this version of source with the same options
+    if not os.path.isfile(filename):
+        return False
+    try:
+        header, _ = read_store_header(filename)
+    except Exception:
+        return False
+    # params go thru json the way they were written; only regex patterns are written by repr, so
+    # containers written with other objects in their params (e.g. a select callable) are never reused
+    try:
+        params = json.loads(json.dumps(params, default=_pattern_repr))
+    except TypeError:
+        return False
+    return header['source']==_source_stamp(source) and header['params']==params
+
+def open_store(filename, inserts=True):
+    # returns (SequenceHeaders, EncodedAlignmentArray) with the code matrix memory-mapped read-only
+    header, start = read_store_header(filename)
+    segment = lambda x: np.memmap(filename, mode='r', offset=start+x['offset'], dtype=np.dtype(x['dtype']), shape=tuple(x['shape'])) \
+                        if np.prod(x['shape']) > 0 else np.zeros(x['shape'], dtype=np.dtype(x['dtype']))
+    seg     = {k: segment(v) for k, v in header['segments'].items()}
+    nseq    = header['shape'][0]
+    names   = RaggedColumn(seg['name_offsets'], seg['name_bytes']).strings(encoding='utf-8')
+    aln     = EncodedAlignmentArray(seg['codes'])
+    if inserts:
+        aln.inserts = InsertArray.empty(nseq, 1+header['shape'][1])
+        for offsets, col in zip(seg['insert_offsets'], np.flatnonzero(seg['insert_used'])):
+            aln.inserts.columns[col] = RaggedColumn(offsets, seg['insert_bytes'])
+    return SequenceHeaders(names), aln
@@ -0,0 +1,28 @@
+import numpy as np
+
+from .encoding import RESIDUES, count_residues, fold_unknown
+from .identity import identity_counts
+
+"""
+    sequence weights for down-weighting redundant sequences in alignment statistics
+    both work on encoded match columns (see EncodedAlignmentArray) with gaps treated as a residue
+"""
+
+def henikoff_weights(codes, block_size=2**22):
+    # position-based weights (Henikoff & Henikoff 1994); weights sum to 1
+    # each column gives 1 / (distinct residues in column * occurences of this residue in column)
+    codes      = fold_unknown(codes)
+    nrow, ncol = codes.shape
+    F          = count_residues(codes, RESIDUES)
+    r          = (F>0).sum(0)
+    score      = np.divide(1, F*r, out=np.zeros(F.shape), where=F>0)
+    step       = max(1, block_size // max(1, ncol))
+    w          = np.zeros(nrow)
+    for i in range(0, nrow, step):
+        w[i:i+step] = score[codes[i:i+step], np.arange(ncol)].sum(1)
+    return w / ncol
+
+def identity_weights(codes, threshold=0.8, **kwargs):
+    # 1 / number of sequences (itself included) sharing at least threshold identity; weights sum to neff
+    # compared in blocks of rows so memory stays bounded for very large alignments (see identity.py)
+    return 1 / identity_counts(codes, threshold=threshold, **kwargs)
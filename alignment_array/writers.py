@@ -0,0 +1,111 @@
+import io
+import gzip
+
+import numpy as np
+
+from .encoding import RESIDUES, CODES
+from .ragged import RaggedColumn, _ragged_index
+
+"""
+    alignment writers working from the encoded representation (codes + ragged inserts)
+    rows are serialized a block at a time into one byte buffer by scattering match characters,
+    insert bytes and headers to precomputed offsets; each block is written as soon as it is ready
+
+        write_a2m    : >header + match states with lowercase inserts (the format gen_array reads)
+                       pad=True pads every insert column with "." so all rows have the same length; gen_array
+                       reads "." as a match character, so padded output is only meant for external tools
+        write_a3m    : a2m without padding
+        write_psicov : match states only, one sequence per line, no headers (ccmpred input)
+        write_fasta  : ungapped uppercase sequences (match states and inserts)
+
+    target is a filename (gzip when it ends with .gz or compress=True) or an open file/pipe;
+    names default to the row numbers
+"""
+
+_CHARS = np.frombuffer(CODES.encode('latin-1'), dtype=np.uint8)
+_UPPER = np.array([ord(chr(i).upper()) if i < 128 else i for i in range(256)], dtype=np.uint8)
+_GAP   = RESIDUES.index('-')
+
+def open_output(target, compress=None):
+    # returns (binary handle, whether it should be closed after writing)
+    # text handles are written thru their binary buffer, after flushing whatever text is pending
+    if hasattr(target, 'write'):
+        if isinstance(target, io.TextIOBase):
+            target.flush()
+        handle = target.buffer if isinstance(target, io.TextIOBase) else target
+        return (gzip.GzipFile(fileobj=handle, mode='wb') if compress else handle), bool(compress)
+    compress = target.endswith('.gz') if compress is None else compress
+    return (gzip.open(target, 'wb') if compress else open(target, 'wb')), True
+
+def _serialize(codes, inserts, names=None, pad=None, gaps=True, upper=False):
+    """
+    returns the bytes of a block of rows
+    codes   : (rows, positions) residue codes
+    inserts : list of (slot, RaggedColumn) for the used insert slots of these rows, or None for match states only
+    names   : list of headers, str (written as utf-8) or bytes (no headers when None)
+    pad     : width of every insert slot (padded with "."), or None for no padding
+    gaps    : keeps "-" in the match states
+    upper   : uppercases the inserts
+    """
+    nrow, npos = codes.shape
+    inserts    = [] if inserts is None else inserts
+    lengths    = np.zeros((nrow, 2*npos+3), dtype=np.int64)
+    if names is not None:
+        names            = [i.encode('utf-8') if isinstance(i, str) else bytes(i) for i in names]
+        names            = RaggedColumn(np.r_[0, np.cumsum(list(map(len, names)))], np.frombuffer(b''.join(names), dtype=np.uint8))
+        lengths[:,0]     = names.lengths() + 2
+    lengths[:,2:-1:2]    = 1 if gaps else codes!=_GAP
+    for slot, column in inserts:
+        lengths[:,1+2*slot] = column.lengths() if pad is None else pad[slot]
+    lengths[:,-1]        = 1
+    starts     = (np.cumsum(lengths.ravel()) - lengths.ravel()).reshape(lengths.shape)
+    out        = np.full(int(lengths.sum()), ord('.'), dtype=np.uint8)
+
+    if names is not None:
+        out[starts[:,0]]  = ord('>')
+        offsets, buffer   = names.compact()
+        out[_ragged_index(starts[:,0]+1, names.lengths())] = buffer
+        out[starts[:,0] + lengths[:,0] - 1] = ord('\n')
+    keep       = np.ones(codes.shape, dtype=bool) if gaps else codes!=_GAP
+    out[starts[:,2:-1:2][keep]] = _CHARS[codes[keep]]
+    for slot, column in inserts:
+        offsets, buffer = column.compact()
+        buffer = _UPPER[buffer] if upper else buffer
+        out[_ragged_index(starts[:,1+2*slot], column.lengths())] = buffer
+    out[starts[:,-1]] = ord('\n')
+    return out.tobytes()
+
+def write_alignment(target, aln, names=None, inserts=True, pad=False, gaps=True, upper=False,
+                    headers=True, compress=None, block_size=2**22):
+    # shared writer behind the format functions; see the module notes
+    aln     = aln.encode()
+    codes   = aln._codes()
+    nrow    = codes.shape[0]
+    slots   = [] if aln.inserts is None or not inserts else [i for i in np.flatnonzero(aln.inserts.used())]
+    width   = {i: int(aln.inserts.columns[i].lengths().max()) for i in slots} if pad else None
+    names   = [str(i) for i in range(nrow)] if names is None and headers else names
+    step    = max(1, block_size // max(1, 2*codes.shape[1] + sum(width.values() if pad else [0]) + 64))
+    handle, close = open_output(target, compress)
+    try:
+        for i in range(0, nrow, step):
+            rows  = slice(i, i+step)
+            block = [(j, aln.inserts.columns[j].take(rows)) for j in slots] if inserts else None
+            handle.write(_serialize(np.asarray(codes[rows]), block, list(names[rows]) if headers else None, width, gaps, upper))
+    finally:
+        if close:
+            handle.close()
+        if hasattr(target, 'write'):
+            target.flush()
+    return target
+
+def write_a2m(target, aln, names=None, pad=False, compress=None, **kwargs):
+    return write_alignment(target, aln, names, pad=pad, compress=compress, **kwargs)
+
+def write_a3m(target, aln, names=None, compress=None, **kwargs):
+    return write_alignment(target, aln, names, pad=False, compress=compress, **kwargs)
+
+def write_psicov(target, aln, compress=None, **kwargs):
+    return write_alignment(target, aln, inserts=False, headers=False, compress=compress, **kwargs)
+
+def write_fasta(target, aln, names=None, compress=None, **kwargs):
+    return write_alignment(target, aln, names, gaps=False, upper=True, compress=compress, **kwargs)
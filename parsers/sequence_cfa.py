@@ -1,6 +1,4 @@
-from itertools import groupby
-
-# CURRENTLY NOT BEING USED
+from itertools import groupby, chain
 
 """
     CFA format standards:
@@ -20,11 +18,13 @@ def read_cfa(file):
 
     Should also be capable of reading feature-linked CFA more testing
     This object offers no direct error checking for formatting
+    (see gen_featurized_array to load the features as aligned tracks)
     """
     f1 = lambda x: x.startswith('>')
     f2 = lambda x: tuple(i.strip() for i in x if not i.isspace())
-    it = iter(groupby(open(file), f1))
-    it = iter(groupby(open(file), f1)) if next(it)[0] else it
+    it = groupby(file if hasattr(file, 'read') else open(file), f1)
+    n  = next(it, None)
+    it = chain([n], it) if n is not None and n[0] else it
     for k, g in it:
         if not k:
             s = f2(g)
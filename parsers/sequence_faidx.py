@@ -0,0 +1,161 @@
+import os
+import mmap
+
+import numpy as np
+
+from ..ext.weblogo.weblogo.utils import FileIndex
+from .sequence_fasta import _scan_records, _SPACE, fasta_compression
+
+"""
+    persistent random access to fasta/a2m/a3m records (like samtools faidx)
+    the index is built with one scan of the file and kept next to it as <file>.hbfai (a numpy .npz)
+    it is rebuilt automatically when the modification time or size of the file changes
+
+    per record :
+        header_offset : byte offset of the ">"
+        header_size   : length of the header line, without ">" and line break
+        offset        : byte offset of the first residue
+        end           : byte offset of the end of the record
+        length        : number of residues
+        line_bases    : residues per line, 0 when lines are irregular (the whole record is read for regions)
+        line_width    : bytes per line, line break included
+    names are the first word of each header; like read_fasta, headers without sequences are skipped
+
+    idx = FastaIndex('uniref.fa')
+    idx['UniRef90_P69905']           # (header, sequence)
+    idx[12]                          # by ordinal, same order as read_fasta
+    idx.fetch('UniRef90_P69905', 10, 40)  # residues 10-39 (0 based, end exclusive)
+"""
+
+def _index_records(buffer):
+    # returns the per record arrays of the index for a buffer holding the whole file
+    fields = {k: [] for k in ('header_offset', 'header_size', 'offset', 'end', 'length', 'line_bases', 'line_width')}
+    names  = []
+    for start, eol, end in _scan_records(buffer):
+        lines = buffer[eol+1:end].split(b'\n')
+        bases = [len(i.strip()) for i in lines]
+        if sum(bases)==0:
+            continue
+        while bases[-1]==0:
+            lines, bases = lines[:-1], bases[:-1]
+        width   = len(lines[0]) + 1
+        residue = lambda x: len(x.rstrip(b'\r'))
+        regular = all(len(i)+1==width and residue(i)==j==bases[0] for i, j in zip(lines[:-1], bases)) \
+                  and residue(lines[-1])==bases[-1] <= bases[0]
+        header  = buffer[start+1:eol].rstrip(b'\r')
+        names  += [(header.split(None, 1) or [b''])[0]]
+        fields['header_offset'] += [start]
+        fields['header_size']   += [len(header)]
+        fields['offset']        += [eol+1]
+        fields['end']           += [end]
+        fields['length']        += [sum(bases)]
+        fields['line_bases']    += [bases[0] if regular else 0]
+        fields['line_width']    += [width]
+    fields = {k: np.array(v, dtype=np.int64) for k, v in fields.items()}
+    fields['name_offsets'] = np.r_[0, np.cumsum(list(map(len, names)))].astype(np.int64)
+    fields['name_bytes']   = np.frombuffer(b''.join(names), dtype=np.uint8)
+    return fields
+
+class FastaIndex(FileIndex):
+    """
+        FileIndex over fasta records backed by a sidecar index file
+        items are names (first word of the header) or ordinals, like FileIndex.tell
+        indexing returns (header, sequence); fetch returns a region of the sequence
+        when a name occurs more than once, the first record is used
+    """
+    def __init__(self, filename, index=None, rebuild=False):
+        if fasta_compression(filename) is not None:
+            raise Exception(f'"{filename}" is compressed and can not be indexed for random access')
+        self.filename    = filename
+        self.index       = filename + '.hbfai' if index is None else index
+        self.indexedfile = open(filename, 'rb')
+        self._buffer     = mmap.mmap(self.indexedfile.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(filename) else b''
+        self._parser     = None
+        self._fields     = None if rebuild else self._load()
+        if self._fields is None:
+            self._fields = _index_records(self._buffer)
+            self._save()
+        self._positions  = self._fields['header_offset']
+        self._keys       = None
+        self._key_dict   = None
+
+    def __repr__(self):
+        return '<FastaIndex: "%s" containing %s sequences>' % (self.filename, len(self))
+
+    def _stamp(self):
+        stat = os.stat(self.filename)
+        return np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+    def _load(self):
+        # returns the stored index if it exists and matches the current file, otherwise None
+        if not os.path.isfile(self.index):
+            return None
+        try:
+            with np.load(self.index) as f:
+                fields = dict(f)
+        except Exception:
+            return None
+        return fields if np.array_equal(fields.pop('stamp', None), self._stamp()) else None
+
+    def _save(self):
+        # the index is still usable in memory when the directory is not writable
+        try:
+            with open(self.index, 'wb') as w:
+                np.savez(w, stamp=self._stamp(), **self._fields)
+        except OSError:
+            pass
+
+    @property
+    def names(self):
+        # names of every record in file order
+        if self._keys is None:
+            offsets    = self._fields['name_offsets']
+            names      = self._fields['name_bytes'].tobytes()
+            self._keys = np.array([names[a:b].decode() for a, b in zip(offsets[:-1], offsets[1:])], dtype=object)
+        return self._keys
+
+    @property
+    def lengths(self):
+        return self._fields['length']
+
+    def ordinal(self, item):
+        # returns the record number of a name or ordinal
+        if isinstance(item, str):
+            if self._key_dict is None:
+                self._key_dict = {}
+                for n, name in enumerate(self.names):
+                    self._key_dict.setdefault(name, n)
+            return self._key_dict[item]
+        return range(len(self))[item]
+
+    def tell(self, item):
+        return int(self._positions[self.ordinal(item)])
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, item):
+        n      = self.ordinal(item)
+        start  = int(self._fields['header_offset'][n]) + 1
+        header = self._buffer[start:start+int(self._fields['header_size'][n])].strip().decode()
+        return header, self.fetch(n)
+
+    def get(self, items):
+        # returns (header, sequence) for several names or ordinals; missing names raise a KeyError
+        return [self[i] for i in items]
+
+    def fetch(self, item, start=None, stop=None):
+        # returns residues start to stop (0 based, end exclusive) of a record without reading the rest of it
+        n          = self.ordinal(item)
+        offset, length, bases, width = (int(self._fields[k][n]) for k in ('offset', 'length', 'line_bases', 'line_width'))
+        start, stop, _ = slice(start, stop).indices(length)
+        stop       = max(start, stop)
+        if bases==0:
+            end = int(self._fields['end'][n])
+            return self._buffer[offset:end].translate(None, _SPACE)[start:stop].decode()
+        byte       = lambda x: offset + (x // bases) * width + x % bases
+        return self._buffer[byte(start):byte(stop)].translate(None, _SPACE).decode()
+
+    def close(self):
+        self._buffer      = b''
+        self.indexedfile.close()
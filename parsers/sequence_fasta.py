@@ -1,6 +1,11 @@
 import io
 import os
-from itertools import groupby
+import re
+import bz2
+import gzip
+import lzma
+import mmap
+from itertools import groupby, chain
 
 def _read_fasta(file):
     """ 
@@ -10,8 +15,9 @@ def _read_fasta(file):
     """
     is_header = lambda x: x.startswith('>')
     compress  = lambda x: ''.join(_.strip() for _ in x)
-    reader    = iter(groupby(open(file), is_header))
-    reader    = iter(groupby(open(file), is_header)) if next(reader)[0] else reader
+    reader    = groupby(file if hasattr(file, 'read') else open(file), is_header)
+    first     = next(reader, None)
+    reader    = chain([first], reader) if first is not None and first[0] else reader
     for key, group in reader:
         if key:
             for header in group:
@@ -22,7 +28,10 @@ def _read_fasta(file):
                 yield header, sequence
 
 def read_fasta(arg):
-    if os.path.exists(arg): 
+    if hasattr(arg, 'read'):
+        # if arg is an open file, pipe or decompression stream; read once from the current position
+        handle = arg if isinstance(arg, io.TextIOBase) else io.TextIOWrapper(arg)
+    elif os.path.exists(arg): 
         # if arg is an alignment file
         handle = open(arg)
     elif type(arg)==str: 
@@ -45,3 +54,104 @@ def read_fasta(arg):
             sequence = compress(group)
             if sequence != '':
                 yield header, sequence
+
+_MAGIC   = {b'\x1f\x8b':'gzip', b'BZh':'bz2', b'\xfd7zXZ\x00':'xz'}
+_SPACE   = b' \t\r\n\x0b\x0c'
+_RESIDUE = re.compile(rb'\S')
+
+_OPENER  = {'gzip':gzip.open, 'bz2':bz2.open, 'xz':lzma.open}
+
+def fasta_compression(arg):
+    # returns 'gzip', 'bz2' or 'xz' from the first bytes of a file (or a peekable stream), otherwise None
+    if hasattr(arg, 'peek'):
+        head = arg.peek(6)[:6]
+    else:
+        with open(arg, 'rb') as f:
+            head = f.read(6)
+    return next((v for k, v in _MAGIC.items() if head.startswith(k)), None)
+
+def _open_binary(arg):
+    # returns (binary file object, whether it can be memory-mapped) for a path or an open handle
+    # compressed files are recognized by their magic number and decompressed as they are read
+    if hasattr(arg, 'read'):
+        handle      = arg.buffer if isinstance(arg, io.TextIOBase) else arg
+        compression = fasta_compression(handle) if hasattr(handle, 'peek') else None
+        return handle if compression is None else _OPENER[compression](handle, 'rb'), False
+    compression = fasta_compression(arg)
+    if compression is None:
+        return open(arg, 'rb'), os.path.getsize(arg) > 0
+    return _OPENER[compression](arg, 'rb'), False
+
+def _scan_records(buffer):
+    # yields (header start, header end, body end) of every record in buffer
+    find = buffer.find
+    pos  = 0 if buffer[:1]==b'>' else find(b'\n>') + 1 or -1
+    while pos >= 0:
+        nxt = find(b'\n>', pos)
+        end = len(buffer) if nxt < 0 else nxt
+        eol = find(b'\n', pos, end)
+        yield pos, end if eol < 0 else eol, end
+        pos = -1 if nxt < 0 else nxt + 1
+
+def _iter_blocks(handle, block_size):
+    # yields blocks of bytes that always end at a record boundary
+    pending = b''
+    while True:
+        block = handle.read(block_size)
+        if not block:
+            yield pending
+            return
+        buffer = pending + block
+        cut    = buffer.rfind(b'\n>')
+        if cut < 0:
+            pending = buffer
+            continue
+        yield buffer[:cut+1]
+        pending = buffer[cut+1:]
+
+def read_fasta_bytes(arg, decode=True, zero_copy=False, block_size=2**24):
+    """
+    bytes level replacement for read_fasta : records are found with bytes.find over an mmap or large blocks
+    arg       : path (plain, gzip, bz2 or xz), open file/pipe/stream, or the contents of a file (str or bytes)
+    yields    : (header, sequence) as str, as bytes with decode=False, or with zero_copy as memoryviews
+                of the raw header and sequence lines (line breaks kept) inside the mmap or block
+    behaviors : same as read_fasta, ignores headers without sequences and anything before the first header
+    """
+    mapped = None
+    if isinstance(arg, (bytes, bytearray, memoryview)):
+        blocks = [bytes(arg)]
+        handle = None
+    elif (type(arg)==str and not os.path.exists(arg)) or (isinstance(arg, io.TextIOBase) and not hasattr(arg, 'buffer')):
+        # contents of a file, or an in memory text stream
+        blocks = [(arg if type(arg)==str else arg.read()).encode()]
+        handle = None
+    else:
+        handle, mappable = _open_binary(arg)
+        if mappable:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            blocks = [mapped]
+        else:
+            blocks = _iter_blocks(handle, block_size)
+    
+    try:
+        for buffer in blocks:
+            view = memoryview(buffer)
+            for start, eol, end in _scan_records(buffer):
+                if zero_copy:
+                    if _RESIDUE.search(buffer, eol, end):
+                        yield view[start+1:eol], view[eol+1:end]
+                    continue
+                sequence = buffer[eol:end].translate(None, _SPACE)
+                if sequence:
+                    header = buffer[start+1:eol].strip()
+                    yield (header.decode(), sequence.decode()) if decode else (header, sequence)
+    finally:
+        # the map is closed unless zero copy views into it are still held, in which case it goes with them
+        if mapped is not None:
+            view = None
+            try:
+                mapped.close()
+            except BufferError:
+                pass
+        if handle is not None and not hasattr(arg, 'read'):
+            handle.close()
@@ -0,0 +1,259 @@
+import numpy as np
+
+from .sequence_fasta import _open_binary
+from ..alignment_array.headerarray import SequenceHeaders
+from ..alignment_array.encoding import residue_table, RESIDUES
+from ..alignment_array.ragged import _ragged_index
+from ..alignment_array.constructor import _assemble, _check_records, _finish_array
+
+"""
+    reads interleaved alignment formats (stockholm, clustal, msf) straight into an encoded alignment
+    without going thru per sequence strings or the weblogo SeqList
+
+    each block of the file is turned into a (sequences, columns) byte matrix as soon as it is complete and
+    encoded right away; only the match state codes and the non-gap insert bytes of earlier blocks are kept
+
+    match versus insert columns:
+        match=None   : the "#=GC RF" line of stockholm files when there is one, otherwise every column
+        match='rf'   : the "#=GC RF" line, required; columns whose RF character is not ".", "-" or "~" are match states
+        match='case' : a2m convention, columns with any uppercase residue or "-" are match states
+        match='all'  : every column is a match state
+    in match states ".", "~" and "-" are gaps and residues are uppercased
+    in insert columns gaps are dropped and residues are lowercased, like the inserts of an a2m file
+
+    the output follows gen_array: (SequenceHeaders, AlignmentArray) or the EncodedAlignmentArray with encode=True
+    stockholm "#=GS <name> DE" descriptions are appended to the names
+
+    for headers, aln in read_stockholm('PF00069_full.sto', encode=True):
+        ...
+    headers, aln = read_clustal('aln.clustal')
+"""
+
+_MATCH = residue_table()
+_MATCH[np.frombuffer(RESIDUES.lower().encode(), dtype=np.uint8)] = _MATCH[np.frombuffer(RESIDUES.encode(), dtype=np.uint8)]
+_MATCH[[ord('.'), ord('~')]] = _MATCH[ord('-')]
+_LOWER = np.array([ord(chr(i).lower()) if i < 128 else i for i in range(256)], dtype=np.uint8)
+_KEEP  = np.ones(256, dtype=bool)
+_KEEP[list(b'.-~ \t\r\n')] = False
+_CASE  = np.zeros(256, dtype=bool)
+_CASE[list(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ-')] = True
+
+class _BlockBuffer:
+    """
+        collects encoded blocks of an interleaved alignment
+        per block:
+            codes   : (sequences, match columns) residue codes
+            runs    : (rows, slots, lengths) of the non-empty inserts of the block, in row order
+            lengths : insert residues of each sequence in the block
+            inserts : lowercase insert bytes of the block, one sequence after another
+    """
+    def __init__(self, nrow):
+        self.nrow    = nrow
+        self.npos    = 0
+        self.codes   = []
+        self.runs    = []
+        self.lengths = []
+        self.inserts = []
+
+    def append(self, chars, match):
+        # chars : (sequences, columns) uint8 characters of a block; match : bool mask of its match columns
+        insert = chars[:,~match]
+        slots  = self.npos + np.cumsum(match)[~match]
+        keep   = _KEEP[insert]
+        self.codes   += [_MATCH[chars[:,match]]]
+        self.lengths += [keep.sum(1)]
+        self.inserts += [_LOWER[insert[keep]]]
+        if insert.shape[1]:
+            unique, first = np.unique(slots, return_index=True)
+            counts        = np.add.reduceat(keep, first, axis=1, dtype=np.int64)
+            rows, cols    = np.nonzero(counts)
+            self.runs    += [(rows.astype(np.int32), unique[cols].astype(np.int32), counts[rows, cols].astype(np.int32))]
+        self.npos    += int(match.sum())
+
+    def finish(self, flanking=True):
+        # returns the EncodedAlignmentArray; inserts are put back in sequence order across the blocks
+        # runs are put in the order of the buffer (sequence, then block) by a stable sort of the block ordered runs;
+        # a slot split by a block boundary gives two runs in a row for the same sequence, which are merged
+        # the blocks are released as soon as they are joined
+        codes   = np.concatenate(self.codes, axis=1)
+        lengths = np.stack(self.lengths, axis=1)
+        starts  = (np.cumsum(lengths.ravel()) - lengths.ravel()).reshape(lengths.shape)
+        buffer  = np.empty(int(lengths.sum()), dtype=np.uint8)
+        for i, inserts in enumerate(self.inserts):
+            buffer[_ragged_index(starts[:,i], lengths[:,i])] = inserts
+        runs    = [np.concatenate(i) for i in zip(*self.runs)] if len(self.runs) else [np.zeros(0, dtype=np.int32)]*3
+        self.codes, self.lengths, self.inserts, self.runs = [], [], [], []
+        order   = np.argsort(runs[0], kind='stable')
+        rows, slots, sizes = (i[order] for i in runs)
+        del runs, order
+        new     = np.flatnonzero(np.r_[True, (rows[1:]!=rows[:-1]) | (slots[1:]!=slots[:-1])][:len(rows)])
+        sizes   = np.add.reduceat(sizes, new) if len(new) else sizes
+        rows, slots = rows[new], slots[new]
+        used    = np.zeros(self.npos+1, dtype=bool)
+        used[slots] = True
+        used[[0,-1]] &= flanking
+        return _assemble(codes, (rows, slots, sizes), buffer, used)
+
+def _parse_blocks(events, label, match=None, flanking=True):
+    """
+    turns a stream of events from one of the format scanners into (names, EncodedAlignmentArray) per alignment
+        ('seq', name, chars)  : a piece of an aligned sequence
+        ('rf', None, chars)   : a piece of the reference annotation
+        ('desc', name, text)  : description of a sequence
+        ('break', None, None) : end of a block (blank line)
+        ('end', None, None)   : end of an alignment
+    a block also ends when a name comes back before a break
+    """
+    def reset():
+        return {'names':[], 'index':{}, 'desc':{}, 'buf':None, 'pieces':[], 'rf':[], 'seen':set(), 'nblock':0}
+
+    def flush(state):
+        # encodes the pending block
+        if len(state['seen'])==0:
+            return
+        if state['buf'] is None:
+            state['buf'] = _BlockBuffer(len(state['names']))
+        pieces = state['pieces']
+        if len(state['seen'])!=len(state['names']):
+            missing = next(i for i, j in zip(state['names'], pieces) if j is None)
+            raise Exception(f'Input file "{label}": "{missing}" is missing from block {1+state["nblock"]}')
+        width  = len(pieces[0])
+        for name, piece in zip(state['names'], pieces):
+            if len(piece)!=width:
+                raise Exception(f'Input file "{label}" does not seem properly aligned: '
+                                f'"{name}" has {len(piece)} columns in block {1+state["nblock"]} instead of {width}')
+        chars  = np.frombuffer(b''.join(pieces), dtype=np.uint8).reshape(len(pieces), width)
+        rf     = b''.join(state['rf'])
+        mode   = ('rf' if len(rf) else 'all') if match is None and state['nblock']==0 else match
+        mode   = state.setdefault('mode', mode)
+        if mode=='rf' and len(rf)!=width:
+            raise Exception(f'Input file "{label}": block {1+state["nblock"]} has {len(rf)} "#=GC RF" columns instead of {width}')
+        columns = {'rf'   : lambda: _KEEP[np.frombuffer(rf, dtype=np.uint8)],
+                   'case' : lambda: _CASE[chars].any(0),
+                   'all'  : lambda: np.ones(width, dtype=bool)}
+        if not isinstance(mode, str) or mode not in columns:
+            raise Exception(f'match must be None, "rf", "case" or "all", not {mode!r}')
+        state['buf'].append(chars, columns[mode]())
+        state['pieces'] = [None] * len(state['names'])
+        state['rf']     = []
+        state['seen']   = set()
+        state['nblock'] += 1
+
+    def finish(state):
+        flush(state)
+        if state['buf'] is None:
+            return None
+        names = [' '.join([i] + state['desc'].get(i, [])) for i in state['names']]
+        return names, state['buf'].finish(flanking)
+
+    state = reset()
+    for kind, name, data in events:
+        if kind=='seq':
+            if name in state['seen']:
+                flush(state)
+            if state['buf'] is None and name not in state['index']:
+                state['index'][name] = len(state['names'])
+                state['names']      += [name]
+                state['pieces']     += [None]
+            if name not in state['index']:
+                raise Exception(f'Input file "{label}": "{name}" is not in the first block of the alignment')
+            row = state['index'][name]
+            state['pieces'][row] = data if state['pieces'][row] is None else state['pieces'][row] + data
+            state['seen'].add(name)
+        elif kind=='rf':
+            state['rf'] += [data]
+        elif kind=='desc':
+            state['desc'].setdefault(name, []).append(data)
+        elif kind=='break':
+            flush(state)
+        elif kind=='end':
+            out = finish(state)
+            if out is not None:
+                yield out
+            state = reset()
+    out = finish(state)
+    if out is not None:
+        yield out
+
+#################################################################################
+#####  format scanners                                                      #####
+#################################################################################
+
+def _scan_stockholm(lines):
+    for line in lines:
+        line = line.strip()
+        if len(line)==0:
+            yield 'break', None, None
+        elif line==b'//':
+            yield 'end', None, None
+        elif line.startswith(b'#=GC RF'):
+            yield 'rf', None, line.split(None, 2)[2]
+        elif line.startswith(b'#=GS'):
+            parts = line.split(None, 3)
+            if len(parts)==4 and parts[2]==b'DE':
+                yield 'desc', parts[1].decode(), parts[3].decode()
+        elif not line.startswith(b'#'):
+            name, seq = line.split(None, 1)
+            yield 'seq', name.decode(), seq.replace(b' ', b'')
+
+def _scan_clustal(lines):
+    # the header line and the conservation lines (nothing but "*", ":", "." and spaces) are skipped
+    # sequence lines may be indented; a trailing residue count after the sequence is dropped
+    header = True
+    for line in lines:
+        if line.isspace() or len(line)==0:
+            yield 'break', None, None
+        elif len(line.strip(b' \t\r\n*:.'))==0 or (header and line.split(None, 1)[0] in (b'CLUSTAL', b'MUSCLE', b'PROBCONS')):
+            header = False
+        else:
+            header = False
+            parts  = line.split()
+            yield 'seq', parts[0].decode(), parts[1]
+
+def _scan_msf(lines):
+    # everything up to the "//" line is the header; position number lines are skipped
+    # sequence lines are "name" followed by space separated groups of residues
+    lines = iter(lines)
+    for line in lines:
+        if line.strip()==b'//':
+            break
+    for line in lines:
+        parts = line.split()
+        if len(parts)==0:
+            yield 'break', None, None
+        elif not all(i.isdigit() for i in parts):
+            yield 'seq', parts[0].decode(), b''.join(parts[1:])
+
+_SCANNERS = {'stockholm':_scan_stockholm, 'clustal':_scan_clustal, 'msf':_scan_msf}
+
+def _read_interleaved(file, fmt, encode=False, match=None, flanking=True, remove_unused_cols=True):
+    # yields (SequenceHeaders, alignment) for every alignment of the file
+    handle, _ = _open_binary(file)
+    label     = getattr(file, 'name', file)
+    try:
+        for names, aln in _parse_blocks(_SCANNERS[fmt](handle), label, match, flanking):
+            yield SequenceHeaders(np.array(names, dtype=object)), _finish_array(aln, encode, flanking, remove_unused_cols)
+    finally:
+        if not hasattr(file, 'read'):
+            handle.close()
+
+def read_stockholm(file, encode=False, match=None, flanking=True, remove_unused_cols=True):
+    """
+    generator: yields (SequenceHeaders, alignment) for every alignment of a stockholm file (e.g. all of Pfam-A.full)
+    file is a filename (plain, gzip, bz2 or xz) or an open file
+    """
+    return _read_interleaved(file, 'stockholm', encode, match, flanking, remove_unused_cols)
+
+def read_clustal(file, encode=False, match='all', flanking=True, remove_unused_cols=True):
+    # returns (SequenceHeaders, alignment) of a clustal file; every column is a match state unless match is given
+    out = list(_read_interleaved(file, 'clustal', encode, match, flanking, remove_unused_cols))
+    if len(out)==0:
+        _check_records(getattr(file, 'name', file), None, None)
+    return out[0]
+
+def read_msf(file, encode=False, match='all', flanking=True, remove_unused_cols=True):
+    # returns (SequenceHeaders, alignment) of a gcg msf file; "." and "~" are gaps
+    out = list(_read_interleaved(file, 'msf', encode, match, flanking, remove_unused_cols))
+    if len(out)==0:
+        _check_records(getattr(file, 'name', file), None, None)
+    return out[0]
@@ -1,6 +1,11 @@
-import sys
+import os
 import re
+import sys
+import mmap
 from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor
+
+from ..alignment_array.constructor import gen_array_records
 
 
 """
@@ -15,10 +20,6 @@ from itertools import groupby
 """
 
 
-# NOTE 200207 : iteration of xmaBlock can only occur once, try and fix?
-#               possible workaround is to re-iterate xmaBlock to rebuild xmaReader
-
-
         # mapgap is closed-source, but it seems to set a max sequence header size so headers may get cut (needs testing)
 
 class XMAAlignmentBlock:
@@ -32,16 +33,21 @@ class XMAAlignmentBlock:
             there is length for max sequence headers, long headers may be truncated in the output
             some programs can not parse the parenthetical flanking sequences, and their generation is not default
 
+        a block is a byte range of the file (see index_xma), it is re-read every time it is iterated
+        so blocks can be iterated more than once, in any order, and sent to other processes
+
         Upon iteration, return (name, aln)
             name  : string; sequence name
             aln   : size 3 tuple; alignment with flanking sequences
     """
-    def __init__(self, stream, name, size, params):
-        self._stream   = stream
+    def __init__(self, file, start, stop, name, size, params, positions):
+        self.file      = file
+        self.start     = start
+        self.stop      = stop
         self.name      = name
         self.size      = size
         self.params    = params
-        self.positions = next(self._stream).count('*')
+        self.positions = positions
     
     def __repr__(self):
         x = self.name, self.size, self.positions
@@ -50,6 +56,13 @@ class XMAAlignmentBlock:
     def __iter__(self):
         return self.walk()
     
+    def _stream(self):
+        # lines of the block after the block header and the position line
+        with open(self.file, 'rb') as f:
+            f.seek(self.start)
+            lines = f.read(self.stop - self.start).decode().splitlines(keepends=True)
+        return iter(lines[1:])
+    
     def walk(self, fx_name=None, fx_seq=None):
         # removes the bracket notation if it got added to the sequence header, else leave it alone
         # in most cases this should allow revert header to the original
@@ -61,25 +74,64 @@ class XMAAlignmentBlock:
         # separates the sequence into flanking segments and the middle alignment part
         fmseq    = re.compile(r'^{\((.*?)\)(.+?)\((.*?)\)}\*$')
         seqer    = lambda x: fmseq.search(x).groups()
-        walker   = groupby(self._stream, lambda x: x.startswith('$'))
+        walker   = groupby(self._stream(), lambda x: x.startswith('$'))
         while not next(walker):
             continue
         for k, g in walker:
             if k:
                 continue
             yield namer(next(g))[1:], seqer(next(g))
+    
+    def records(self, flanking=True):
+        # yields (name, sequence) with the flanking segments as lowercase inserts, as a cfa file would have them
+        for name, (left, middle, right) in self:
+            yield name, left.lower() + middle + right.lower() if flanking else middle
+    
+    def to_array(self, encode=False, flanking=True, remove_unused_cols=True):
+        # returns (SequenceHeaders, AlignmentArray) of the block, with the same options as gen_array
+        records = self.records(flanking=flanking)
+        return gen_array_records(records, encode, flanking, remove_unused_cols, label=f'{self.file}:{self.name}')
+
+def index_xma(file):
+    """
+        returns an XMAAlignmentBlock for every block of an XMA formatted file
+        block headers are found with one scan over the memory-mapped file
+    """
+    fr = re.compile(rb'^\[\d+_\((.+?)\)\=(.+?)\((.+?)\)(.+)$', re.M)
+    with open(file, 'rb') as f:
+        if os.path.getsize(file)==0:
+            return []
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        hits = list(fr.finditer(data))
+        ends = [i.start() for i in hits[1:]] + [len(data)]
+        out  = []
+        for hit, end in zip(hits, ends):
+            start = data.find(b'\n', hit.start(), end) + 1 or end
+            stop  = data.find(b'\n', start, end)
+            line  = data[start:end if stop < 0 else stop]
+            x     = [i.decode() for i in hit.groups()]
+            out  += [XMAAlignmentBlock(file, start, end, x[1], x[2], x[3], line.count(b'*'))]
+        data.close()
+    return out
 
 def read_xma(file):
     """
         An iterator object to read XMA formatted files
     """
-    fr = re.compile(r'^\[\d+_\((.+?)\)\=(.+?)\((.+?)\)(.+)$')
-    f1 = lambda x: bool(re.match('^\[\d+_\(', x))
-    f2 = lambda x: fr.search(x).groups()
-    it = iter(groupby(open(file), f1))
-    it = iter(groupby(open(file), f1)) if next(it)[0] else it
-    for k, g in it:
-        if k:
-            n = f2(next(g))
-        else:
-            yield XMAAlignmentBlock(g, n[1], n[2], n[3])
+    for block in index_xma(file):
+        yield block
+
+def _xma_block_array(block, kwargs):
+    return block.name, block.to_array(**kwargs)
+
+def read_xma_arrays(file, processes=1, **kwargs):
+    """
+        returns [(block name, (SequenceHeaders, AlignmentArray)), ...] for every block of an XMA file
+        blocks are independent and are parsed in a process pool when processes > 1 (None uses every core)
+        kwargs are passed to XMAAlignmentBlock.to_array
+    """
+    blocks = index_xma(file)
+    if processes==1:
+        return [_xma_block_array(i, kwargs) for i in blocks]
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(_xma_block_array, blocks, [kwargs]*len(blocks)))
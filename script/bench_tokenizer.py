@@ -0,0 +1,53 @@
+import sys
+import time
+
+import numpy as np
+
+from ..parsers.sequence_fasta import read_fasta
+from ..alignment_array.constructor import vectorize_aligned_sequence, tokenize_aligned_sequence, tokens_to_list
+
+"""
+
+benchmark of the bytes tokenizer against vectorize_aligned_sequence
+
+python -m <package>.script.bench_tokenizer [alignment.a2m] [max_seqs]
+
+without a file, random a2m rows (300 positions, ~15% insert slots) are generated
+both tokenizers are checked to give the same layout before timing
+
+"""
+
+def random_rows(n=5000, npos=300, seed=0):
+    rng    = np.random.default_rng(seed)
+    upper  = np.array(list('ARNDCQEGHILKMFPSTWYV-'))
+    lower  = np.array(list('arndcqeghilkmfpstwyv'))
+    for i in range(n):
+        match  = rng.choice(upper, npos+1)
+        insert = [''.join(rng.choice(lower, rng.integers(1, 6))) if rng.random() < 0.15 else '' for _ in range(npos+1)]
+        yield f'row{i}', ''.join(a+b for a, b in zip(insert, match))[:-1]
+
+def timed(fxn, seqs, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for seq in seqs:
+            fxn(seq)
+        best  = min(best, time.perf_counter() - start)
+    return best
+
+def main(infile=None, max_seqs=5000):
+    reader = random_rows(max_seqs) if infile is None else read_fasta(infile)
+    seqs   = [seq for n, (_, seq) in zip(range(max_seqs), reader)]
+    for flanking in (True, False):
+        for seq in seqs:
+            assert vectorize_aligned_sequence(seq, flanking) == tokens_to_list(*tokenize_aligned_sequence(seq, flanking), flanking=flanking)
+    nchar = sum(map(len, seqs))
+    old   = timed(vectorize_aligned_sequence, seqs)
+    new   = timed(tokenize_aligned_sequence, seqs)
+    print(f'{len(seqs)} sequences, {nchar} characters')
+    print(f'vectorize_aligned_sequence : {old:8.3f}s {nchar/old/1e6:8.2f} Mchar/s')
+    print(f'tokenize_aligned_sequence  : {new:8.3f}s {nchar/new/1e6:8.2f} Mchar/s')
+    print(f'speedup                    : {old/new:8.2f}x')
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None, int(sys.argv[2]) if len(sys.argv) > 2 else 5000)
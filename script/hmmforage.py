@@ -11,6 +11,8 @@ import pandas as pd
 
 import pyhmmer
 
+from ..parsers.sequence_fasta import read_fasta_bytes, fasta_compression
+
 """
 
 db = HMMforage.run(
@@ -33,7 +35,8 @@ db.export_parquet('hits.parquet', block_size=500)
 class HMMforage:
     @staticmethod
     def get_size_fasta(fasta_file, verbose=True):
-        it = filter(lambda x: x.startswith('>'), open(fasta_file, 'r'))
+        i  = 0
+        it = read_fasta_bytes(fasta_file, zero_copy=True)
         for i, _ in enumerate(it, 1):
             if verbose and (i % 200 == 0):
                 sys.stderr.write(f'{i}\r')
@@ -41,19 +44,29 @@ class HMMforage:
             sys.stderr.write(f'{i}\n')
         return i        
     
+    @staticmethod
+    def iter_sequences_fasta(fasta_file, alphabet):
+        # plain files are read by easel; compressed ones (gzip, bz2 or xz) with read_fasta_bytes and digitized like easel would
+        if fasta_compression(fasta_file) is None:
+            with pyhmmer.easel.SequenceFile(fasta_file, digital=True, alphabet=alphabet) as seqs:
+                yield from seqs
+            return
+        for header, sequence in read_fasta_bytes(fasta_file, decode=False):
+            name, description = (header.split(None, 1) + [b''])[:2]
+            yield pyhmmer.easel.TextSequence(name=name, description=description, sequence=sequence.decode()).digitize(alphabet)
+    
     @staticmethod
     def iter_chunks_fasta(fasta_file, n_chars=0):
         n_chars = n_chars if n_chars > 0 else 1
-        with pyhmmer.easel.SequenceFile(fasta_file, digital=True, alphabet=pyhmmer.easel.Alphabet.amino()) as seqs:
-            buffer, buffer_size = [], 0
-            for seq in seqs:
-                buffer += [seq]
-                buffer_size += seq.sequence.shape[0]
-                if buffer_size > n_chars:                
-                    yield buffer
-                    buffer, buffer_size = [], 0
-            if buffer_size > 0:
+        buffer, buffer_size = [], 0
+        for seq in HMMforage.iter_sequences_fasta(fasta_file, pyhmmer.easel.Alphabet.amino()):
+            buffer += [seq]
+            buffer_size += seq.sequence.shape[0]
+            if buffer_size > n_chars:                
                 yield buffer
+                buffer, buffer_size = [], 0
+        if buffer_size > 0:
+            yield buffer
     
     @staticmethod
     def hashify_sequences(seqs):